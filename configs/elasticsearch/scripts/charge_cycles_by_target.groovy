@@ -0,0 +1,8 @@
+// elasticsearch_dsl currently prevents storing of empty objects
+if ( !ctx._source.cycles ) {
+    ctx._source.cycles = [:]
+}
+
+for ( charge in charges.entrySet() ) {
+    ctx._source.cycles[charge.key] = ctx._source.cycles.get(charge.key, 0) + charge.value
+}
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function
 
+import atexit
 from collections import OrderedDict
 from functools import partial
 import httplib
@@ -16,12 +17,18 @@ from jsonschema import RefResolver
 from swagger_spec_validator.validator20 import validate_spec
 
 from . import views
-from .auth.middleware import authenticate_user
-from .auth.models import auth_index, Customer, User
+from .auth.cycles import CycleAccumulator
+from .auth.aliases import aliases
+from .auth.exceptions import ForbiddenError
+from .auth.middleware import ClaimsCache, SecurityTable, authenticate_user
+from .auth.models import auth_index, customers_by_name, users_by_email, Customer, User
 from .auth.utils import create_oauth_flow
-from .persistence import SwaggerSchemaStore, DataStore, configure_elasticsearch
+from .persistence import DocumentCache, SwaggerSchemaStore, DataStore, configure_elasticsearch
 from .auth.views import auth
 from . import swagger
+from .modificators import ProcessorRegistry
+from .validators import ValidatorRegistry
+from .versioning import VersionArchiver
 
 # if there is a .env file, pull it in as early as possible. by setting raise_error_if_not_found
 # and catching the exception, we stop it from polluting our logs
@@ -35,6 +42,10 @@ except IOError:
 _pattern_collection = '/<index>/<doc_type>/'
 _pattern_document = '/<index>/<doc_type>/<id>'
 _pattern_search = _pattern_collection + '_search'
+_pattern_count = _pattern_collection + '_count'
+_pattern_bulk = _pattern_collection + '_bulk'
+_pattern_export = _pattern_collection + '_export'
+_pattern_mget = _pattern_collection + '_mget'
 _pattern_retrieve_archive = _pattern_document + '/_archive'
 
 _path_map = {
@@ -47,6 +58,10 @@ _path_map = {
 
     # our special endpoints
     'search': (_pattern_search, views.search_documents, ['post']),
+    'count': (_pattern_count, views.count_documents, ['get', 'post']),
+    'bulk': (_pattern_bulk, views.bulk_create_documents, ['post']),
+    'export': (_pattern_export, views.export_documents, ['get']),
+    'mget': (_pattern_mget, views.retrieve_documents, ['post']),
     'retrieve_archived': (
         _pattern_retrieve_archive, views.retrieve_archived_document, ['get']
     )
@@ -99,6 +114,13 @@ def configure_endpoints(app):
         methods=['GET']
     )
 
+    app.add_url_rule(
+        '/_msearch',
+        'msearch',
+        views.multi_search_documents,
+        methods=['POST']
+    )
+
     for operation, config in _path_map.items():
         path = config[0]
         endpoint = 'document_{}'.format(operation)
@@ -273,6 +295,11 @@ def _list_routes(app):
     return app
 
 
+def _forbidden_response(error):
+    # type: (ForbiddenError) -> flask.app.Response
+    return views.error_response(httplib.FORBIDDEN, error.error)
+
+
 def create_app(
     schema_path='schemas/',
     rest_subdir='indexes',
@@ -301,10 +328,45 @@ def create_app(
 
         return views.error_response(500, problem)
 
+    app.register_error_handler(ForbiddenError, _forbidden_response)
+
     # Connect to Elasticsearch
     es = configure_elasticsearch(app)
     app.cluster = ClusterClient(es)
-    app.datastore = DataStore(es)
+    if app.config['DOCUMENT_CACHE_DOC_TYPES']:
+        document_cache = DocumentCache(
+            app.config['DOCUMENT_CACHE_DOC_TYPES'],
+            max_size=app.config['DOCUMENT_CACHE_SIZE'],
+            ttl=app.config['DOCUMENT_CACHE_TTL'],
+        )
+    else:
+        document_cache = None
+
+    app.datastore = DataStore(
+        es,
+        read_after_write=app.config['ELASTICSEARCH_READ_AFTER_WRITE'],
+        refresh_reads=app.config['ELASTICSEARCH_REFRESH_READS'],
+        document_cache=document_cache,
+    )
+
+    # Cache customers and users looked up by name and email (e.g. when issuing tokens)
+    customers_by_name.ttl = users_by_email.ttl = app.config['AUTH_LOOKUP_CACHE_TTL']
+
+    # Charge cycles in batches instead of with an update per request
+    if app.config['CYCLES_ACCUMULATE']:
+        app.cycle_accumulator = CycleAccumulator(
+            es,
+            index=Customer._doc_type.index,
+            doc_type=Customer._doc_type.name,
+            logger=app.logger,
+            flush_interval=app.config['CYCLES_FLUSH_INTERVAL'],
+            flush_threshold=app.config['CYCLES_FLUSH_THRESHOLD'],
+            customer_ttl=app.config['CYCLES_CUSTOMER_TTL'],
+        )
+        app.cycle_accumulator.start()
+        atexit.register(app.cycle_accumulator.stop)
+    else:
+        app.cycle_accumulator = None
 
     # Connect to Database
     from .database import db
@@ -315,6 +377,21 @@ def create_app(
         db.engine.execute('CREATE EXTENSION IF NOT EXISTS HSTORE')
         db.create_all()
 
+    # Archive document versions in batches instead of with a commit per request
+    if app.config['ARCHIVE_WRITE_BEHIND']:
+        app.version_archiver = VersionArchiver(
+            app,
+            app.config['ARCHIVE_SPILL_FILE'],
+            max_size=app.config['ARCHIVE_QUEUE_SIZE'],
+            flush_interval=app.config['ARCHIVE_FLUSH_INTERVAL'],
+            flush_threshold=app.config['ARCHIVE_FLUSH_THRESHOLD'],
+            put_timeout=app.config['ARCHIVE_QUEUE_TIMEOUT'],
+        )
+        app.version_archiver.start()
+        atexit.register(app.version_archiver.stop)
+    else:
+        app.version_archiver = None
+
     # Create Geocoder
     app.geocode = partial(GoogleV3().geocode, exactly_one=False)
 
@@ -322,12 +399,23 @@ def create_app(
     app.register_blueprint(auth)
     app.before_first_request(create_oauth_flow)
     app.before_request(authenticate_user)
+    app.jwt_claims = ClaimsCache(
+        max_size=app.config['AUTH_JWT_CACHE_SIZE'],
+        ttl=app.config['AUTH_JWT_CACHE_TTL'],
+    )
 
     # Setup URL rules
     configure_endpoints(app)
 
     # Load schemas
     app.schemastore = SwaggerSchemaStore()
+    app.validators = ValidatorRegistry(
+        app.schemastore,
+        app.datastore,
+        app.config['UPLOAD_MNT'],
+    )
+    app.processors = ProcessorRegistry(app.schemastore, app.datastore)
+    app.security = SecurityTable(app.schemastore)
 
     schema_dir = Path(schema_path)
     rest_dir = schema_dir.joinpath(rest_subdir)
@@ -352,6 +440,16 @@ def create_app(
         )
         configure_mappings(index, swagger_spec, es)
 
+    # Know the customers' aliases to reject requests without permission before querying them
+    aliases.max_size = app.config['AUTH_ALIAS_CACHE_SIZE']
+    aliases.refresh_interval = app.config['AUTH_ALIAS_REFRESH_INTERVAL']
+    aliases.prime(es)
+
+    # Compile validators, modificator plans and security requirements once instead of per request
+    app.validators.compile_all()
+    app.processors.compile_all()
+    app.security.compile()
+
     _list_routes(app)
 
     app.logger.info('RelES reporting for duty...')
@@ -5,10 +5,16 @@ from __future__ import (
     unicode_literals,
 )
 
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
 from enum import Enum
 from flask import g
 import wrapt
 
+from .exceptions import ForbiddenError
+
 AliasType = Enum('AliasType', ['read', 'write'])
 
 _ALIAS_PATTERNS = {
@@ -17,38 +23,187 @@ _ALIAS_PATTERNS = {
 }
 
 
+class AliasTable(object):
+    """
+    Memoize the aliases of (index, customer, functionality) and their components, both bounded
+    to `max_size` entries (the oldest are dropped). Once primed from the aliases in Elasticsearch
+    it also knows which aliases exist, which is kept current by `Customer._update_aliases`.
+    Aliases missing from it may have been created by another process, so they are checked with
+    Elasticsearch and only known not to exist for `refresh_interval` seconds after that.
+    """
+
+    def __init__(self, max_size=10000, refresh_interval=10):
+        # type: (int, float) -> None
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+
+        self._lock = Lock()
+        # (index, customer, functionality) -> alias
+        self._aliases = OrderedDict()
+        # alias -> (index, customer, functionality)
+        self._components = OrderedDict()
+
+        self._es = None
+        self._existing = None  # type: Optional[set]
+        # alias -> when Elasticsearch confirmed that it does not exist
+        self._missing = {}
+
+    def _remember(self, alias, components):
+        # type: (str, Tuple[str, str, str]) -> None
+        with self._lock:
+            for cache, key, value in (
+                (self._aliases, components, alias),
+                (self._components, alias, components),
+            ):
+                cache.pop(key, None)
+                cache[key] = value
+
+                while len(cache) > self.max_size:
+                    cache.popitem(last=False)
+
+    def get_alias(self, index, customer, functionality):
+        # type: (str, str, str) -> str
+        components = (index, customer, functionality)
+
+        alias = self._aliases.get(components)
+        if alias is None:
+            alias = _ALIAS_PATTERNS[functionality].format(index, customer)
+            self._remember(alias, components)
+
+        return alias
+
+    def unalias(self, alias):
+        # type: (str) -> Tuple[str, str, str]
+        components = self._components.get(alias)
+        if components is not None:
+            return components
+
+        index, customer, suffix = alias.split('_', 2)
+
+        for functionality, pattern in _ALIAS_PATTERNS.items():
+            if pattern.endswith(suffix):
+                components = index, customer, functionality
+                self._remember(alias, components)
+                return components
+
+        raise Exception('Could not unalias: %s' % alias)
+
+    def prime(self, es):
+        # type: (elasticsearch.Elasticsearch) -> None
+        """Learn which aliases exist in Elasticsearch (and keep checking back with `es`)."""
+        existing = {
+            alias
+            for index in es.indices.get_alias().values()
+            for alias in index.get('aliases', {})
+        }
+
+        with self._lock:
+            self._es = es
+            self._existing = existing
+            self._missing = {}
+
+    def exists(self, alias):
+        # type: (str) -> Optional[bool]
+        """Whether the alias exists, `None` if the table has not been primed."""
+        if self._existing is None:
+            return None
+
+        if alias in self._existing:
+            return True
+
+        now = time()
+        if now - self._missing.get(alias, 0) < self.refresh_interval:
+            return False
+
+        # maybe created by another process
+        if self._es.indices.exists_alias(name=alias):
+            self.add(alias)
+            return True
+
+        with self._lock:
+            self._missing[alias] = now
+
+            # forget what is outdated anyway, instead of growing without bounds
+            if len(self._missing) > self.max_size:
+                self._missing = {
+                    missing: at for missing, at in self._missing.items()
+                    if now - at < self.refresh_interval
+                }
+
+        return False
+
+    def add(self, alias):
+        # type: (str) -> None
+        if self._existing is not None:
+            with self._lock:
+                self._existing.add(alias)
+                self._missing.pop(alias, None)
+
+    def remove(self, alias):
+        # type: (str) -> None
+        if self._existing is not None:
+            with self._lock:
+                self._existing.discard(alias)
+                self._missing[alias] = time()
+
+
+aliases = AliasTable()
+
+
 def translate_index(functionality):
     """
     A decorator for index translation.
 
-    Returns a decorator that translates an index at runtime.
+    Returns a decorator that translates an index at runtime (see `permitted_alias`).
     """
     @wrapt.decorator
     def wrapper(wrapped, instance, args, kwargs):
         if 'customer' not in g:
             raise Exception('Cannot translate an index without a customer')
 
-        _index = kwargs.pop('index')
-        alias = get_alias(_index, g.customer['name'], functionality.name)
+        alias = permitted_alias(kwargs.pop('index'), functionality)
+
         return wrapped(index=alias, *args, **kwargs)
 
     return wrapper
 
 
-# TODO @memoize?
+def is_single_name(name):
+    # type: (Any) -> bool
+    """
+    Whether `name` names a single index or doc_type, rather than several (comma separated,
+    wildcards or `_all`) that Elasticsearch would resolve beyond the customer's aliases.
+    """
+    return (
+        isinstance(name, basestring) and
+        bool(name) and
+        name != '_all' and
+        not any(character in name for character in ',*')
+    )
+
+
+def permitted_alias(index, functionality):
+    # type: (str, AliasType) -> str
+    """
+    The alias of the current customer for `functionality` on `index`. Raises a `ForbiddenError`
+    for anything but a single index and for aliases known not to exist (the customer lacks the
+    permission), so these are rejected without asking Elasticsearch.
+    """
+    if is_single_name(index):
+        alias = get_alias(index, g.customer['name'], functionality.name)
+        if aliases.exists(alias) is not False:
+            return alias
+
+    raise ForbiddenError('No {} permission for index {}'.format(functionality.name, index))
+
+
 def get_alias(index, customer, functionality):
     # type: (str, str, AliasType) -> str
     """Get an alias for a given index."""
-    return _ALIAS_PATTERNS[functionality].format(index, customer)
+    return aliases.get_alias(index, customer, functionality)
 
 
 def unalias(alias):
     """Parse the given alias into its components."""
     # type: (str) -> Tuple[str, str, AliasType]
-    index, customer, suffix = alias.split('_', 2)
-
-    for functionality, pattern in _ALIAS_PATTERNS.items():
-        if pattern.endswith(suffix):
-            return index, customer, functionality
-
-    raise Exception('Could not unalias: %s' % alias)
+    return aliases.unalias(alias)
@@ -0,0 +1,180 @@
+# coding: utf-8
+
+"""Coalesced accounting of the cycles customers are charged."""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+from collections import Counter, defaultdict
+import httplib
+from threading import Event, Lock, Thread
+from time import time
+
+from elasticsearch.helpers import streaming_bulk
+
+from .exceptions import NotFoundError
+
+
+class CycleAccumulator(object):
+    """
+    Collect the cycles charged per customer and target instead of updating the customer for every
+    request, and write them with one scripted update per customer in a bulk request. Charges are
+    flushed by a background thread every `flush_interval` seconds and as soon as
+    `flush_threshold` charges are pending, and when the accumulator is stopped.
+    """
+
+    def __init__(
+        self,
+        es,
+        index,
+        doc_type,
+        logger,
+        flush_interval=5,
+        flush_threshold=1000,
+        customer_ttl=60,
+    ):
+        # type: (elasticsearch.Elasticsearch, str, str, logging.Logger, float, int, float) -> None
+        self._es = es
+        self._index = index
+        self._doc_type = doc_type
+        self._logger = logger
+        self._flush_interval = flush_interval
+        self._flush_threshold = flush_threshold
+        self._customer_ttl = customer_ttl
+
+        self._lock = Lock()
+        # customer_id -> target -> cycles
+        self._charges = defaultdict(Counter)
+        self._pending = 0
+        # customer_id -> time until which the customer is known to exist
+        self._customers = {}
+
+        self._flush_requested = Event()
+        self._stopped = Event()
+        self._thread = None
+
+        self.counters = Counter()
+
+    def start(self):
+        # type: () -> None
+        self._thread = Thread(target=self._run, name='cycle-accumulator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        # type: () -> None
+        """Stop flushing periodically and flush what is pending."""
+        self._stopped.set()
+        self._flush_requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self._flush_interval)
+            self._flush_requested.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                self._logger.exception('Failed to flush charged cycles')
+
+    def customer_exists(self, customer_id):
+        # type: (str) -> bool
+        """Whether the customer exists, known customers are only checked every `customer_ttl`."""
+        now = time()
+
+        with self._lock:
+            known = self._customers.get(customer_id, 0) > now
+
+        if known:
+            self.counters['customer_hits'] += 1
+            return True
+
+        self.counters['customer_misses'] += 1
+        exists = self._es.exists(index=self._index, doc_type=self._doc_type, id=customer_id)
+
+        with self._lock:
+            if exists:
+                self._customers[customer_id] = now + self._customer_ttl
+            else:
+                self._customers.pop(customer_id, None)
+
+        return exists
+
+    def charge(self, customer_id, charges):
+        # type: (str, Mapping[str, int]) -> None
+        """Charge cycles for targets (`{target: cycles}`), raises if the customer is unknown."""
+        if not self.customer_exists(customer_id):
+            raise NotFoundError('Invalid customer')
+
+        with self._lock:
+            self._charges[customer_id].update(charges)
+            self._pending += 1
+            flush = self._pending >= self._flush_threshold
+
+        if flush:
+            # leave the flush to the thread instead of delaying the request
+            self._flush_requested.set()
+
+    def flush(self):
+        # type: () -> None
+        with self._lock:
+            charges, self._charges = self._charges, defaultdict(Counter)
+            self._pending = 0
+
+        if not charges:
+            return
+
+        customer_ids = list(charges)
+        actions = (
+            {
+                '_op_type': 'update',
+                '_index': self._index,
+                '_type': self._doc_type,
+                '_id': customer_id,
+                '_retry_on_conflict': 3,
+                'script': {
+                    'file': 'charge_cycles_by_target',
+                    'lang': 'groovy',
+                    'params': {
+                        'charges': dict(charges[customer_id]),
+                    }
+                },
+            }
+            for customer_id in customer_ids
+        )
+
+        self.counters['flushes'] += 1
+
+        for customer_id, (ok, result) in zip(customer_ids, streaming_bulk(
+            self._es,
+            actions,
+            raise_on_error=False,
+            raise_on_exception=False,
+        )):
+            if ok:
+                continue
+
+            error = result.get('update', {})
+            if error.get('status') == httplib.NOT_FOUND:
+                self._logger.debug(
+                    'Dropping cycles %s of non-existent customer `%s`',
+                    dict(charges[customer_id]), customer_id
+                )
+                with self._lock:
+                    self._customers.pop(customer_id, None)
+            else:
+                self._logger.warning(
+                    'Failed to charge customer `%s`, keeping cycles %s: %s',
+                    customer_id, dict(charges[customer_id]), error.get('error')
+                )
+                with self._lock:
+                    self._charges[customer_id].update(charges[customer_id])
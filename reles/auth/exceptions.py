@@ -3,10 +3,13 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
-
 import httplib
 
-from elasticsearch.exceptions import ConflictError, NotFoundError
+from elasticsearch.exceptions import (
+    AuthorizationException,
+    ConflictError,
+    NotFoundError,
+)
 
 
 class AuthError(Exception):
@@ -21,3 +24,8 @@ class NotFoundError(NotFoundError, AuthError):
 class ConflictError(ConflictError, AuthError):
     def __init__(self, error):
         super(ConflictError, self).__init__(httplib.CONFLICT, error)
+
+
+class ForbiddenError(AuthorizationException, AuthError):
+    def __init__(self, error):
+        super(ForbiddenError, self).__init__(httplib.FORBIDDEN, error)
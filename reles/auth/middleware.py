@@ -11,39 +11,200 @@ from __future__ import (
     unicode_literals,
 )
 
+from collections import Counter, OrderedDict
+from hashlib import sha256
 import httplib
 import os
+import re
+from threading import Lock
+import time
 
 from flask import current_app, g
 from flask import request as current_request
 from jose import ExpiredSignatureError, JWTError, jwt
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
 
-from .exceptions import AuthError
+from .. import swagger
 from ..views import error_response
+from .exceptions import AuthError
 
+# swagger path templating (`{id}`) to werkzeug rule placeholders (`<id>`)
+_PATH_PARAMETER = re.compile(r'{([^}/]+)}')
+
+
+def _requires_jwt(security):
+    # type: (Sequence[dict]) -> bool
+    return any('jwt' in requirement for requirement in security)
+
+
+class SecurityTable(object):
+    """
+    Whether a JWT is required, per path and method of every spec in the `SwaggerSchemaStore`.
+    Operations may override the spec's `security`. Static paths are looked up in a dict, paths
+    with parameters are matched by a werkzeug router, and everything else falls back to the
+    requirements of the endpoint (the first path segment). Recompiled when a spec is replaced.
+    """
+
+    def __init__(self, schemastore):
+        # type: (reles.persistence.SwaggerSchemaStore) -> None
+        self._schemastore = schemastore
+
+        # (method, path) -> requires a JWT
+        self._static = {}
+        self._router = Map().bind('')
+        # endpoint -> requires a JWT
+        self._endpoints = {}
+
+        schemastore.add_listener(lambda endpoint: self.compile())
+
+    def compile(self):
+        # type: () -> None
+        static = {}
+        rules = []
+        endpoints = {}
+
+        for endpoint in self._schemastore.list_endpoints():
+            spec = swagger.build_swagger_json(endpoint, self._schemastore.get_schema(endpoint))
+            security = spec.get('security', [])
+            endpoints[endpoint] = _requires_jwt(security)
+
+            for path, operations in spec.get('paths', {}).items():
+                for verb, operation in operations.items():
+                    # skip any non-operations (e.g. `parameters`)
+                    if verb not in swagger._OPERATION_VERBS:
+                        continue
+
+                    required = _requires_jwt(operation.get('security', security))
+                    methods = [verb.upper()] + (['HEAD'] if verb == 'get' else [])
+
+                    if _PATH_PARAMETER.search(path):
+                        rules.append(Rule(
+                            _PATH_PARAMETER.sub(r'<\1>', path),
+                            endpoint=required,
+                            methods=methods,
+                        ))
+                    else:
+                        static.update(((method, path), required) for method in methods)
+
+        self._static, self._router, self._endpoints = static, Map(rules).bind(''), endpoints
+
+    def requires_jwt(self, method, path):
+        # type: (str, str) -> Optional[bool]
+        """Whether the request needs a JWT, `None` if there is no spec for its endpoint."""
+        required = self._static.get((method, path))
+        if required is not None:
+            return required
+
+        try:
+            required, _ = self._router.match(path, method)
+        except HTTPException:
+            # unknown path/method (or trailing slash redirect), use the endpoint's `security`
+            return self._endpoints.get(path.split(os.sep)[1])
+
+        return required
+
+
+class ClaimsCache(object):
+    """
+    Keep the claims of verified JWTs (by a digest of the token, the key and the algorithms) so
+    they need not be decoded again. Claims are only handed out while they are valid (`nbf` to
+    `exp`) and for at most `ttl` seconds, the least recently used are dropped beyond `max_size`
+    (`0` disables caching).
+
+    The cache accepts no token that decoding it would not, so it cannot revoke tokens either:
+    changes to users and customers take effect with the next token.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        # type: (int, float) -> None
+        self._max_size = max_size
+        self._ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+        # hits, misses & evictions
+        self.counters = Counter()
+
+    @staticmethod
+    def _key(token, key, algorithms):
+        # type: (str, str, str) -> str
+        return sha256(b'\0'.join(
+            value.encode('utf-8') if isinstance(value, unicode) else value
+            for value in (token, key, algorithms)
+        )).digest()
+
+    def get(self, token, key, algorithms):
+        # type: (str, str, str) -> Optional[dict]
+        cache_key = self._key(token, key, algorithms)
+        now = time.time()
+
+        with self._lock:
+            claims, expires = self._entries.pop(cache_key, (None, now))
+
+            if claims is None or not claims.get('nbf', now) <= now < expires:
+                self.counters['misses'] += 1
+                return None
+
+            # (re-)insert as most recently used
+            self._entries[cache_key] = claims, expires
+            self.counters['hits'] += 1
+            return claims
+
+    def put(self, token, key, algorithms, claims):
+        # type: (str, str, str, dict) -> None
+        if not self._max_size or 'exp' not in claims:
+            # never cache tokens that don't expire
+            return
 
-def login_required():
-    endpoint = current_request.path.split(os.sep)[1]
+        expires = min(claims['exp'], time.time() + self._ttl)
+
+        with self._lock:
+            self._entries[self._key(token, key, algorithms)] = claims, expires
 
-    spec = current_app.schemastore.get_schema(endpoint)
-    if spec is None:
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        # type: () -> None
+        """Forget all claims."""
+        with self._lock:
+            self._entries.clear()
+
+
+def login_required():
+    required = current_app.security.requires_jwt(current_request.method, current_request.path)
+    if required is None:
         current_app.logger.debug(
             'There is no spec for endpoint \'%s\' (parsed from \'%s\')',
-            endpoint,
+            current_request.path.split(os.sep)[1],
             current_request.path,
         )
         raise AuthError('Failed to determine security requirements')
-    else:
-        # This would need to get smarter if we wanted more specific security
-        # settings further down the tree. A swagger parser would be nice to
-        # match `paths` against the request, since the spec may contain
-        # `parameters` `"in": "path"`.
-        security_requirements = spec.get('security', {})
 
-    return 'jwt' in [
-        name for requirement in security_requirements
-        for name in requirement.keys()
-    ]
+    return required
+
+
+def _decode_claims(token):
+    # type: (str) -> dict
+    """Verify and decode a JWT, claims of tokens seen before are taken from the `ClaimsCache`."""
+    key = current_app.config['AUTH_JWT_SECRET']
+    algorithms = current_app.config['AUTH_JWT_ALGORITHM']
+
+    cache = getattr(current_app, 'jwt_claims', None)
+    if cache is not None:
+        claims = cache.get(token, key, algorithms)
+        if claims is not None:
+            return claims
+
+    claims = jwt.decode(token, key=key, algorithms=algorithms)
+
+    if cache is not None:
+        cache.put(token, key, algorithms, claims)
+
+    return claims
 
 
 def authenticate_user():
@@ -60,11 +221,7 @@ def authenticate_user():
         return error_response(httplib.UNAUTHORIZED, 'Authentication failed')
 
     try:
-        claims = jwt.decode(
-            auth_header[1],
-            key=current_app.config['AUTH_JWT_SECRET'],
-            algorithms=current_app.config['AUTH_JWT_ALGORITHM']
-        )
+        claims = _decode_claims(auth_header[1])
     except ExpiredSignatureError as error:
         # This is a specialized `JWTError`, so check first
         return error_response(httplib.UNAUTHORIZED, 'Your token has expired')
@@ -9,15 +9,20 @@ from __future__ import (
     unicode_literals,
 )
 
+from collections import Counter
+from copy import deepcopy
+import httplib
+from threading import Lock
+from time import time
 
 import elasticsearch
 import elasticsearch_dsl as dsl
 from flask import current_app as app
+from flask import has_app_context
 
 from ..versioning import ArchivingDocType
+from .aliases import aliases, get_alias, unalias
 from .exceptions import ConflictError, NotFoundError
-from .aliases import get_alias, unalias
-
 
 auth_index = dsl.Index('auth')
 auth_index.settings(
@@ -25,6 +30,61 @@ auth_index.settings(
     number_of_replicas=1
 )
 
+
+class LookupCache(object):
+    """
+    Cache documents looked up by a unique field for `ttl` seconds (`0` disables caching). Saving a
+    document of the cached type clears the cache, changes by other processes only expire: users
+    and customers deleted elsewhere are still found (a customer recreated elsewhere with its old
+    `_id`) until then. Security checks need to look up with `cached=False`.
+    """
+
+    def __init__(self, ttl=60):
+        # type: (float) -> None
+        self.ttl = ttl
+
+        self._entries = {}
+        self._lock = Lock()
+
+        # hits, misses, expired & invalidations
+        self.counters = Counter()
+
+    def get(self, key):
+        # type: (str) -> Optional[dsl.DocType]
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] < time():
+                del self._entries[key]
+                self.counters['expired'] += 1
+                entry = None
+
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+
+            self.counters['hits'] += 1
+
+        # callers may modify (and save) what they get, so only ever hand out copies
+        return deepcopy(entry[1])
+
+    def put(self, key, document):
+        # type: (str, dsl.DocType) -> None
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = (time() + self.ttl, deepcopy(document))
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            self._entries.clear()
+            self.counters['invalidations'] += 1
+
+
+customers_by_name = LookupCache()
+users_by_email = LookupCache()
+
+
 class Customer(ArchivingDocType):
     """Model a customer."""
 
@@ -36,9 +96,19 @@ class Customer(ArchivingDocType):
         index = auth_index._name
 
     @classmethod
-    def get_by_name(cls, name):
-        # type: (str, dsl.Index) -> reles.auth.models.Customer
-        """Get the first customer with the given name."""
+    def get_by_name(cls, name, cached=True):
+        # type: (str, bool) -> reles.auth.models.Customer
+        """Get the first customer with the given name (see `customers_by_name` for caching)."""
+        customer = customers_by_name.get(name) if cached else None
+        if customer is None:
+            customer = cls._search_by_name(name)
+            customers_by_name.put(name, customer)
+
+        return customer
+
+    @classmethod
+    def _search_by_name(cls, name):
+        # type: (str) -> reles.auth.models.Customer
         response = cls.search(index=auth_index._name).filter(
             'term',
             name=name
@@ -60,8 +130,27 @@ class Customer(ArchivingDocType):
                 )
             )
 
+    @classmethod
+    def _cycle_accumulator(cls):
+        # type: () -> Optional[reles.auth.cycles.CycleAccumulator]
+        return getattr(app, 'cycle_accumulator', None) if has_app_context() else None
+
+    @classmethod
+    def exists(cls, customer_id):
+        # type: (str) -> bool
+        accumulator = cls._cycle_accumulator()
+        if accumulator is not None:
+            # cached by the accumulator, which has to check anyway when charging
+            return accumulator.customer_exists(customer_id)
+
+        return cls.get(customer_id, ignore=httplib.NOT_FOUND) is not None
+
     @classmethod
     def charge_cycles(cls, customer_id, target, cycles):
+        accumulator = cls._cycle_accumulator()
+        if accumulator is not None:
+            return accumulator.charge(customer_id, {target: cycles})
+
         es = dsl.connections.connections.get_connection(cls._doc_type.using)
 
         try:
@@ -87,6 +176,38 @@ class Customer(ArchivingDocType):
             )
             raise NotFoundError('Invalid customer')
 
+    @classmethod
+    def charge_cycles_by_target(cls, customer_id, charges):
+        # type: (str, Mapping[str, int]) -> dict
+        """Charge cycles for several targets (`{target: cycles}`) with a single update."""
+        accumulator = cls._cycle_accumulator()
+        if accumulator is not None:
+            return accumulator.charge(customer_id, charges)
+
+        es = dsl.connections.connections.get_connection(cls._doc_type.using)
+
+        try:
+            return es.update(
+                index=cls._doc_type.index,
+                doc_type=cls._doc_type.name,
+                id=customer_id,
+                body={
+                    'script': {
+                        'file': 'charge_cycles_by_target',
+                        'lang': 'groovy',
+                        'params': {
+                            'charges': charges,
+                        }
+                    }
+                }
+            )
+        except elasticsearch.NotFoundError:
+            app.logger.debug(
+                'Failed to charge non-existent customer `%s` with cycles %s',
+                customer_id, charges
+            )
+            raise NotFoundError('Invalid customer')
+
     def add_permissions(self, permissions):
         """Add the given permissions."""
         for index, added in permissions.items():
@@ -105,47 +226,88 @@ class Customer(ArchivingDocType):
         """Save a customer instance."""
         self._update_aliases()
         super(Customer, self).save(using, index, validate, **kwargs)
+        customers_by_name.clear()
+
+    def delete(self, using=None, index=None, **kwargs):
+        super(Customer, self).delete(using, index, **kwargs)
+        customers_by_name.clear()
 
     def _update_aliases(self):
-        alias_actions = []
+        self.reconcile_aliases([self])
 
-        # delete aliases of removed permissions
-        #  this encodes knowledge about how aliases are formatted
-        affected_indexes = app.es.indices.get_alias('*_%s_*' % self.name)
-        for index in affected_indexes:
-            permissions_by_index = self.permissions.to_dict().get(index, [])
+    @classmethod
+    def reconcile_aliases(cls, customers=None):
+        # type: (Optional[Sequence[Customer]]) -> list
+        """
+        Create and delete aliases to match the permissions of the customers (all by default) with
+        a single snapshot of the existing aliases and a single `update_aliases` request. Returns
+        the applied alias actions.
+        """
+        if customers is None:
+            customers = list(cls.search(index=auth_index._name).scan())
 
-            for alias in affected_indexes[index]['aliases']:
-                _, customer, permission = unalias(alias)
-                if customer == self.name and permission not in permissions_by_index:
-                    alias_actions.append(
-                        self._build_alias_action('remove', index, permission)
-                    )
-
-        # create aliases for added permissions
-        for index in self.permissions:
-            for permission in self.permissions[index]:
-                if not app.es.indices.exists_alias(name=get_alias(index, self.name, permission)):
-                    alias_actions.append(
-                        self._build_alias_action('add', index, permission)
-                    )
+        if len(customers) == 1:
+            # only the indexes with aliases of this customer
+            #  this encodes knowledge about how aliases are formatted
+            existing = app.es.indices.get_alias('*_%s_*' % customers[0].name)
+        else:
+            existing = app.es.indices.get_alias()
+
+        alias_actions = _alias_actions(
+            {customer.name: customer.permissions.to_dict() for customer in customers},
+            existing,
+        )
 
         if alias_actions:
             app.es.indices.update_aliases(body={'actions': alias_actions})
 
-    def _build_alias_action(self, action, index, permission):
-        return {
-            action: {
-                'index': index,
-                'alias': get_alias(index, self.name, permission)
-            }
-        }
+            for action in alias_actions:
+                if 'add' in action:
+                    aliases.add(action['add']['alias'])
+                else:
+                    aliases.remove(action['remove']['alias'])
+
+        return alias_actions
 
     def refresh(self):
         """Sync the instance with the ES."""
         self.__dict__.update(self.get(self.meta.id).__dict__)
 
 
+def _alias_actions(permissions, existing):
+    # type: (Mapping[str, Mapping[str, Sequence[str]]], Mapping[str, dict]) -> list
+    """
+    The `update_aliases` actions turning the `existing` aliases (as returned by `get_alias`) into
+    the aliases of the customers' `{customer: {index: [permission]}}`.
+    """
+    actions = []
+
+    # delete aliases of removed permissions
+    for index in sorted(existing):
+        for alias in sorted(existing[index].get('aliases', {})):
+            try:
+                _, customer, permission = unalias(alias)
+            except Exception:
+                # not one of our aliases
+                continue
+
+            if (
+                customer in permissions and
+                permission not in permissions[customer].get(index, [])
+            ):
+                actions.append({'remove': {'index': index, 'alias': alias}})
+
+    # create aliases for added permissions
+    for customer in sorted(permissions):
+        for index in sorted(permissions[customer]):
+            for permission in sorted(permissions[customer][index]):
+                alias = get_alias(index, customer, permission)
+                if alias not in existing.get(index, {}).get('aliases', {}):
+                    actions.append({'add': {'index': index, 'alias': alias}})
+
+    return actions
+
+
 class User(ArchivingDocType):
     """Model a user."""
 
@@ -156,8 +318,17 @@ class User(ArchivingDocType):
         index = auth_index._name
 
     @classmethod
-    def get_by_email(cls, address):
-        """Get the first user with the given email."""
+    def get_by_email(cls, address, cached=True):
+        """Get the first user with the given email (see `users_by_email` for caching)."""
+        user = users_by_email.get(address) if cached else None
+        if user is None:
+            user = cls._search_by_email(address)
+            users_by_email.put(address, user)
+
+        return user
+
+    @classmethod
+    def _search_by_email(cls, address):
         response = cls.search(index=auth_index._name).filter(
             'term',
             email=address
@@ -178,3 +349,14 @@ class User(ArchivingDocType):
                     [user.meta.id for user in response.hits],
                 )
             )
+
+    def save(self, using=None, index=None, validate=True, **kwargs):
+        """Save a user instance."""
+        result = super(User, self).save(using, index, validate, **kwargs)
+        users_by_email.clear()
+
+        return result
+
+    def delete(self, using=None, index=None, **kwargs):
+        super(User, self).delete(using, index, **kwargs)
+        users_by_email.clear()
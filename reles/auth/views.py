@@ -75,8 +75,9 @@ def renew_token():
     if g.token_is_renewable:
         try:
             # Check if user is still valid. If the token leaked, deleting the
-            # compromised user is the only way to prevent indefinite renewals
-            User.get_by_email(g.user['email'])
+            # compromised user is the only way to prevent indefinite renewals, so
+            # don't trust a cache that misses deletions by other processes
+            User.get_by_email(g.user['email'], cached=False)
         except NotFoundError as error:
             return error_response(httplib.BAD_REQUEST, error.error)
         except ConflictError as error:
@@ -88,7 +89,7 @@ def renew_token():
 
         new_token = format_jwt(
             g.user,
-            sessionize_customer(Customer.get_by_name(g.customer['name'])),
+            sessionize_customer(Customer.get_by_name(g.customer['name'], cached=False)),
             renewable=True,
         )
         response = make_response(new_token)
@@ -19,17 +19,41 @@ TESTING = config('TESTING', default=False, cast=bool)
 
 SECRET_KEY = config('SECRET_KEY')
 
+ARCHIVE_WRITE_BEHIND = config('ARCHIVE_WRITE_BEHIND', default=False, cast=bool)
+ARCHIVE_FLUSH_INTERVAL = config('ARCHIVE_FLUSH_INTERVAL', default=1, cast=float)
+ARCHIVE_FLUSH_THRESHOLD = config('ARCHIVE_FLUSH_THRESHOLD', default=500, cast=int)
+ARCHIVE_QUEUE_SIZE = config('ARCHIVE_QUEUE_SIZE', default=10000, cast=int)
+ARCHIVE_QUEUE_TIMEOUT = config('ARCHIVE_QUEUE_TIMEOUT', default=1, cast=float)
+# versions that could not be archived, replayed once Postgres is available. Required with
+# ARCHIVE_WRITE_BEHIND, keep it on persistent storage (it may be shared by the workers of a host)
+ARCHIVE_SPILL_FILE = config('ARCHIVE_SPILL_FILE', default='')
+
+AUTH_ALIAS_CACHE_SIZE = config('AUTH_ALIAS_CACHE_SIZE', default=10000, cast=int)
+AUTH_ALIAS_REFRESH_INTERVAL = config('AUTH_ALIAS_REFRESH_INTERVAL', default=10, cast=float)
 AUTH_JWT_ALGORITHM = config('AUTH_JWT_ALGORITHM', default='HS512')
 AUTH_JWT_SECRET = config('AUTH_JWT_SECRET', default='phukoo9EMie5mei1yaeteeN')
+AUTH_JWT_CACHE_SIZE = config('AUTH_JWT_CACHE_SIZE', default=10000, cast=int)
+AUTH_JWT_CACHE_TTL = config('AUTH_JWT_CACHE_TTL', default=300, cast=float)
+AUTH_LOOKUP_CACHE_TTL = config('AUTH_LOOKUP_CACHE_TTL', default=60, cast=float)
 AUTH_TOKEN_ISSUER = config('AUTH_TOKEN_ISSUER', default='RelES')
 AUTH_TOKEN_LIFETIME = config('AUTH_TOKEN_LIFETIME', default=36000, cast=int)
 
+BULK_CHUNK_SIZE = config('BULK_CHUNK_SIZE', default=500, cast=int)
+
+CYCLES_ACCUMULATE = config('CYCLES_ACCUMULATE', default=False, cast=bool)
+CYCLES_FLUSH_INTERVAL = config('CYCLES_FLUSH_INTERVAL', default=5, cast=float)
+CYCLES_FLUSH_THRESHOLD = config('CYCLES_FLUSH_THRESHOLD', default=1000, cast=int)
+CYCLES_CUSTOMER_TTL = config('CYCLES_CUSTOMER_TTL', default=60, cast=float)
 CYCLES_CRUD = config('CYCLES_CRUD', default=1)
 CYCLES_FACTOR_REFRESH = config('CYCLES_FACTOR_REFRESH', default=2)
 CYCLES_GET_ARCHIVED_DOCUMENT = config('CYCLES_GET_ARCHIVED_DOCUMENT', default=1)
 CYCLES_FILE_UPLOAD = config('CYCLES_FILE_UPLOAD', default=1)
 CYCLES_GEOCODING = config('CYCLES_GEOCODING', default=1)
 
+DOCUMENT_CACHE_DOC_TYPES = config('DOCUMENT_CACHE_DOC_TYPES', default='', cast=Csv())
+DOCUMENT_CACHE_SIZE = config('DOCUMENT_CACHE_SIZE', default=10000, cast=int)
+DOCUMENT_CACHE_TTL = config('DOCUMENT_CACHE_TTL', default=300, cast=int)
+
 ELASTICSEARCH_HOST = config('ELASTICSEARCH_HOST')
 ELASTICSEARCH_MAPPINGS = config(
     'ELASTICSEARCH_MAPPINGS',
@@ -40,6 +64,16 @@ ELASTICSEARCH_MAPPINGS = config(
         ]
     },
 )
+ELASTICSEARCH_READ_AFTER_WRITE = config(
+    'ELASTICSEARCH_READ_AFTER_WRITE',
+    default=False,
+    cast=bool
+)
+ELASTICSEARCH_REFRESH_READS = config(
+    'ELASTICSEARCH_REFRESH_READS',
+    default=False,
+    cast=bool
+)
 ELASTICSEARCH_NON_RESETTABLE_INDEX_SETTINGS = config(
     'ELASTICSEARCH_NON_RESETTABLE_INDEX_SETTINGS',
     default=[
@@ -47,6 +81,13 @@ ELASTICSEARCH_NON_RESETTABLE_INDEX_SETTINGS = config(
     ]
 )
 
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=1000, cast=int)
+
+LIST_DEFAULT_LIMIT = config('LIST_DEFAULT_LIMIT', default=100, cast=int)
+LIST_MAX_LIMIT = config('LIST_MAX_LIMIT', default=1000, cast=int)
+
+MSEARCH_MAX_SEARCHES = config('MSEARCH_MAX_SEARCHES', default=20, cast=int)
+
 SQLALCHEMY_DATABASE_URI = config('DATABASE_URL')
 SQLALCHEMY_ECHO = config('SQLALCHEMY_ECHO', default=False, cast=bool)
 SQLALCHEMY_TRACK_MODIFICATIONS = config('SQLALCHEMY_TRACK_MODIFICATIONS', default=False, cast=bool)
@@ -1,11 +1,13 @@
 from __future__ import absolute_import
 
 from collections import namedtuple
+from functools import partial
 from time import time
 
 from flask import g
 from jsonschema import ValidationError
 
+from reles.persistence import DefinitionRegistry
 from reles.references import resolve_field_reference
 
 ProcessingContext = namedtuple(
@@ -13,6 +15,10 @@ ProcessingContext = namedtuple(
     ('datastore', 'doc_id', 'full_entity', 'full_schema')
 )
 
+# `modificators` are (processor, config) pairs applicable to the node itself, `properties` are
+# (key, plan) pairs and `items` the plan for array items - all pruned to paths with modificators
+_PlanNode = namedtuple('_PlanNode', ('modificators', 'properties', 'items'))
+
 
 def _log_access(entity, schema, parent, context):
     if entity:
@@ -41,7 +47,7 @@ def _fill_from_fkey(entity, schema, parent, context):
     """
 
     def denormalize(id):
-        source_document = context.datastore.get_document(_index, _doc_type, id)
+        source_document = context.datastore.get_document(_index, _doc_type, id, cached=True)
         if _field:
             docs = resolve_field_reference(_field, None, source_document)
             return docs[0] if docs else None
@@ -75,15 +81,11 @@ def _fill_from_fkey(entity, schema, parent, context):
 
 def _include_parents(entity, schema, parent, context):
     # type: (list, dict, Any, ProcessingContext) -> Sequence
-    def _get_parents(child_id):
-        while child_id is not None:
-            yield child_id
-            child_id = context.datastore.get_document(
-                index,
-                doc_type,
-                child_id
-            ).get(parent_field)
-
+    """
+    Expands the given IDs with all their ancestors. The parent chains are walked breadth first, a
+    whole level of ancestors is fetched at once and every ID is only fetched once. Cyclic chains
+    are rejected.
+    """
     if not entity:
         # Nothing to expand
         return entity
@@ -93,12 +95,65 @@ def _include_parents(entity, schema, parent, context):
     parent_field = schema['parent_field']
 
     parents = set()
-    for child_id in entity:
-        parents.update([id for id in _get_parents(child_id)])
+    parent_of = {}
+    level = set(entity)
+
+    while level:
+        parents.update(level)
+
+        ids = list(level)
+        documents = context.datastore.get_documents(index, doc_type, ids, cached=True)
+
+        level = set()
+        for id, document in zip(ids, documents):
+            if document is None:
+                raise ValidationError(
+                    'Failed to include parents: no such document {}/{}/{}'.format(
+                        index,
+                        doc_type,
+                        id,
+                    )
+                )
+
+            parent_id = document.get(parent_field)
+            if parent_id is not None:
+                parent_of[id] = parent_id
+                if parent_id not in parents:
+                    level.add(parent_id)
+
+    _check_parent_cycles(parent_of, index, doc_type)
 
     return list(parents)
 
 
+def _check_parent_cycles(parent_of, index, doc_type):
+    # type: (Mapping[str, str], str, str) -> None
+    """Raise a `ValidationError` naming the first cycle found in the `{id: parent_id}` chains."""
+    acyclic = set()
+
+    for start in sorted(parent_of):
+        chain = []
+        positions = {}
+
+        node = start
+        while node in parent_of and node not in acyclic:
+            if node in positions:
+                cycle = chain[positions[node]:] + [node]
+                raise ValidationError(
+                    'Failed to include parents: cyclic parents {}/{}/{}'.format(
+                        index,
+                        doc_type,
+                        ' -> '.join('{}'.format(node) for node in cycle),
+                    )
+                )
+
+            positions[node] = len(chain)
+            chain.append(node)
+            node = parent_of[node]
+
+        acyclic.update(chain)
+
+
 class Processor(object):
     _processors = {
         'x-log-access': _log_access,
@@ -116,37 +171,69 @@ class Processor(object):
         if processors is not None:
             self._processors = processors
 
-    def _process(self, key, schema, entity, parent, context):
-        # type: (str, dict, Union[dict, Sequence, str], Union[dict, Sequence, str], ProcessingContext) -> Union[dict, Sequence, str]
+        self.plan = self._compile(schema) or _PlanNode((), (), None)
+
+    def _compile(self, schema):
+        # type: (dict) -> Optional[_PlanNode]
         """
-        Recursive helper function for process(). Applies processors in a *depth first* manner, if
-        no processors are applicable it ends up copying the entity.
+        Compiles the *modificator plan* of a (sub-)schema: a tree containing only the paths that
+        lead to a modificator. Returns `None` if there is no modificator in the given schema.
+        """
+        modificators = tuple(
+            (processor, schema[processor_name])
+            for processor_name, processor in self._processors.items()
+            if processor_name in schema
+        )
+
+        properties = ()
+        items = None
+
+        if schema.get('type') == 'object':
+            properties = tuple(
+                (key, plan) for key, plan in (
+                    (_key, self._compile(_schema))
+                    for _key, _schema in schema.get('properties', {}).items()
+                ) if plan is not None
+            )
+        elif schema.get('type') == 'array' and isinstance(schema.get('items'), dict):
+            items = self._compile(schema['items'])
+
+        if modificators or properties or items is not None:
+            return _PlanNode(modificators, properties, items)
+        else:
+            return None
+
+    def _process(self, plan, entity, parent, context):
+        # entity, parent & result are Union[dict, Sequence, str]
+        # type: (_PlanNode, Any, Any, ProcessingContext) -> Any
+        """
+        Recursive helper function for process(). Applies processors in a *depth first* manner,
+        following the modificator plan only.
         """
 
         # apply any applicable processors on this entity...
-        for processor_name, processor in self._processors.items():
-            if processor_name in schema:
-                entity = processor(entity, schema[processor_name], parent, context)
+        for processor, config in plan.modificators:
+            entity = processor(entity, config, parent, context)
 
         # ...then recurse deeper into the schema/entity
-        if schema['type'] == 'object' and isinstance(entity, dict):
-            for _key, _schema in schema.get('properties', {}).items():
+        if plan.properties and isinstance(entity, dict):
+            for _key, _plan in plan.properties:
                 # If the field has not been sent, `None` is passed down as the entity.
                 # Modifiers will be applied, but recursion stops due to type checks.
-                processed = self._process(_key, _schema, entity.get(_key), entity, context)
+                processed = self._process(_plan, entity.get(_key), entity, context)
                 if processed is not None:
                     entity[_key] = processed
             return entity
-        elif schema['type'] == 'array' and isinstance(entity, list):
-            return [self._process(key, schema['items'], _entity, entity, context) for _entity in entity]
+        elif plan.items is not None and isinstance(entity, list):
+            return [self._process(plan.items, _entity, entity, context) for _entity in entity]
         else:
             return entity
 
     def process(self, entity, id=None):
         # type: (Union[dict, Sequence, str]) -> Union[dict, Sequence, str]
         """
-        Applies any configured processors to the given entity (document). The result will always
-        be a new object and given entity unmodified, even if no processor was applicable.
+        Applies any configured processors to the given entity (document). Fields without any
+        processors (or processors further down) are left untouched.
         """
 
         context = ProcessingContext(
@@ -156,10 +243,21 @@ class Processor(object):
             full_schema=self.schema,
         )
 
-        for key, sub_schema in self.schema['properties'].items():
-            processed = self._process(key, sub_schema, entity.get(key, None), entity, context)
+        for key, plan in self.plan.properties:
+            processed = self._process(plan, entity.get(key, None), entity, context)
             if processed is not None:
                 entity[key] = processed
 
         # TODO: eliminate `return` statement, use `entity` as in-out-parameter
         return entity
+
+
+class ProcessorRegistry(DefinitionRegistry):
+    """Holds a `Processor` (with its compiled modificator plan) per (endpoint, doc_type)."""
+
+    def __init__(self, schemastore, datastore):
+        # type: (SwaggerSchemaStore, DataStore) -> None
+        super(ProcessorRegistry, self).__init__(
+            schemastore,
+            partial(Processor, datastore=datastore),
+        )
@@ -1,10 +1,24 @@
 from __future__ import absolute_import
 
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from copy import deepcopy
+from itertools import islice
+from threading import Lock
+from time import time
 
 from elasticsearch import TransportError
+from elasticsearch.helpers import streaming_bulk
 from elasticsearch_dsl.connections import connections
-from typing import Optional, Sequence  # noqa
+from flask import g, has_request_context
+from typing import (  # noqa
+    Callable,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 
 def configure_elasticsearch(app):
@@ -41,10 +55,22 @@ class SwaggerSchemaStore(object):
     def __init__(self):
         # type: (None) -> None
         self._schemas = defaultdict(dict)
+        self._listeners = []
 
     def add_schema(self, endpoint, schema):
         # type: (str, dict) -> None
-        self._schemas[endpoint]= schema
+        replaced = endpoint in self._schemas
+
+        self._schemas[endpoint] = schema
+
+        if replaced:
+            for listener in self._listeners:
+                listener(endpoint)
+
+    def add_listener(self, listener):
+        # type: (Callable[[str], None]) -> None
+        """Register a callback to be notified (with the endpoint) when a schema gets replaced."""
+        self._listeners.append(listener)
 
     def get_schema(self, endpoint, definition=None):
         # type: (str, str) -> dict
@@ -65,15 +91,170 @@ class SwaggerSchemaStore(object):
         return self._schemas.keys()
 
 
+SearchResult = namedtuple('SearchResult', ('documents', 'total', 'aggregations', 'took'))
+
+
+def _request_cache():
+    # type: () -> Optional[dict]
+    """
+    The identity map of documents read during the current request, keyed by (index, doc_type,
+    id). It lives on `flask.g`, so it is discarded with the request. `None` outside of requests.
+    """
+    if not has_request_context():
+        return None
+
+    return g.setdefault('document_cache', {})
+
+
+class DocumentCache(object):
+    """
+    A process wide LRU cache (with a TTL) for documents of rarely changing doc types like
+    categories, keyed by (index, doc_type, id). Writes through the `DataStore` invalidate entries,
+    writes by other processes only expire with the TTL.
+    """
+
+    def __init__(self, doc_types, max_size=10000, ttl=300):
+        # type: (Iterable[str], int, int) -> None
+        self._doc_types = frozenset(doc_types)
+        self._max_size = max_size
+        self._ttl = ttl
+
+        self._entries = OrderedDict()
+        # (doc_type, id) -> keys of the entries, to forget documents without scanning all entries
+        self._keys = defaultdict(set)
+        self._lock = Lock()
+
+        # hits, misses & evictions
+        self.counters = Counter()
+
+    def _unindex(self, key):
+        # type: (Tuple[str, str, str]) -> None
+        keys = self._keys.get(key[1:])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[key[1:]]
+
+    def caches(self, doc_type):
+        # type: (str) -> bool
+        return doc_type in self._doc_types
+
+    def get(self, key, version=None):
+        # type: (Tuple[str, str, str], Optional[int]) -> Optional[dict]
+        """Get a cached document, `None` if it is not cached (in the given `_version`)."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is not None and entry[0] < time():
+                self.counters['expired'] += 1
+                entry = None
+
+            if entry is None or (version is not None and entry[1].get('_version') != version):
+                self._unindex(key)
+                self.counters['misses'] += 1
+                return None
+
+            # (re-)insert as most recently used
+            self._entries[key] = entry
+            self.counters['hits'] += 1
+            return entry[1]
+
+    def put(self, key, document):
+        # type: (Tuple[str, str, str], dict) -> None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time() + self._ttl, document)
+            self._keys[key[1:]].add(key)
+
+            while len(self._entries) > self._max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._unindex(evicted)
+                self.counters['evictions'] += 1
+
+    def forget(self, doc_type, id):
+        # type: (str, str) -> None
+        if not self.caches(doc_type):
+            return
+
+        with self._lock:
+            for key in self._keys.pop((doc_type, id), ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+
+class DefinitionRegistry(object):
+    """
+    Base for objects compiled (by `compile_definition`) from schema definitions and cached per
+    (endpoint, doc_type). The compiled objects of an endpoint are dropped when its schema is
+    replaced in the schema store and compiled again on their next use.
+    """
+
+    def __init__(self, schemastore, compile_definition):
+        # type: (SwaggerSchemaStore, Callable[[dict], object]) -> None
+        self._schemastore = schemastore
+        self._compile = compile_definition
+        self._compiled = {}
+
+        schemastore.add_listener(self.invalidate)
+
+    def compile(self, endpoint):
+        # type: (str) -> None
+        """Compile all definitions of the given endpoint."""
+        for doc_type, schema in self._schemastore.list_definitions(endpoint).items():
+            self._compiled[(endpoint, doc_type)] = self._compile(schema)
+
+    def compile_all(self):
+        # type: () -> None
+        for endpoint in self._schemastore.list_endpoints():
+            self.compile(endpoint)
+
+    def invalidate(self, endpoint):
+        # type: (str) -> None
+        for key in [key for key in self._compiled.keys() if key[0] == endpoint]:
+            self._compiled.pop(key, None)
+
+    def get(self, endpoint, doc_type):
+        # type: (str, str) -> Optional[object]
+        """Get the compiled object for a doc_type, `None` if there is no schema for it."""
+        try:
+            return self._compiled[(endpoint, doc_type)]
+        except KeyError:
+            schema = self._schemastore.get_schema(endpoint, doc_type)
+            if not schema:
+                return None
+
+            compiled = self._compiled[(endpoint, doc_type)] = self._compile(schema)
+            return compiled
+
+
 class DataStore(object):
-    def __init__(self, es):
-        # type: (elasticsearch.Elasticsearch) -> None
+    def __init__(self, es, read_after_write=False, refresh_reads=False, document_cache=None):
+        # type: (elasticsearch.Elasticsearch, bool, bool, Optional[DocumentCache]) -> None
         self._es = es
 
+        # Re-read written documents (with a refreshing GET) instead of building them from the
+        # submitted body and the write response
+        self._read_after_write = read_after_write
+
+        # Refresh the shard before GETting documents by default. Realtime GETs return the latest
+        # version of a document anyway, so this is only needed to sync with searches.
+        self._refresh_reads = refresh_reads
+
+        # Shared by all requests, only used by reads that ask for it (see `get_document`)
+        self.document_cache = document_cache
+
+        # Number of reads (and refreshes they forced) by kind
+        self.counters = Counter()
+
     @staticmethod
     def _transform(es_document):
         result = {}
-        result.update(es_document['_source'])
+        result.update(es_document.get('_source', {}))
         result['_id'] = es_document['_id']
 
         # TODO is this actually an error in list()s result?
@@ -82,13 +263,170 @@ class DataStore(object):
 
         return result
 
-    def get_document(self, index, doc_type, id, version=None):
-        # type: (str, str, str, int) -> dict
-        document = self._es.get(index=index, doc_type=doc_type, id=id, refresh=True)
-        return self._transform(document)
+    def _read_args(self, kind, refresh):
+        # type: (str, bool) -> dict
+        self.counters[kind] += 1
 
-    def create_document(self, index, doc_type, document, id=None, refresh=False):
-        # type: (str, str, dict, Optional[str]) -> dict
+        if refresh:
+            self.counters['{}_refresh'.format(kind)] += 1
+            return {'refresh': True}
+        else:
+            return {'realtime': True}
+
+    def _refresh_index(self, kind, index):
+        # type: (str, str) -> None
+        self.counters['{}_refresh'.format(kind)] += 1
+        self._es.indices.refresh(index=index)
+
+    def _forget(self, doc_type, id):
+        # type: (str, str) -> None
+        """Drop a changed document from the caches, whichever index/alias it was read from."""
+        cache = _request_cache()
+        if cache:
+            for key in [key for key in cache if key[1:] == (doc_type, id)]:
+                del cache[key]
+
+        if self.document_cache is not None:
+            self.document_cache.forget(doc_type, id)
+
+    def _lookup(self, key, cached, version):
+        # type: (Tuple[str, str, str], bool, Optional[int]) -> Optional[dict]
+        request_cache = _request_cache()
+
+        if request_cache is not None and key in request_cache:
+            document = request_cache[key]
+            if version is None or document.get('_version') == version:
+                self.counters['request_cache_hits'] += 1
+                return document
+
+        if cached and self.document_cache is not None and self.document_cache.caches(key[1]):
+            document = self.document_cache.get(key, version)
+            if document is not None:
+                if request_cache is not None:
+                    request_cache[key] = document
+                return document
+
+        return None
+
+    def _remember(self, key, document, cached):
+        # type: (Tuple[str, str, str], dict, bool) -> bool
+        """Put a fetched document into the caches, returns whether it has been cached at all."""
+        remembered = False
+
+        request_cache = _request_cache()
+        if request_cache is not None:
+            request_cache[key] = document
+            remembered = True
+
+        if cached and self.document_cache is not None and self.document_cache.caches(key[1]):
+            self.document_cache.put(key, document)
+            remembered = True
+
+        return remembered
+
+    def get_document(
+        self, index, doc_type, id, version=None, refresh=None, cached=False, fields=None
+    ):
+        # type: (str, str, str, int, Optional[bool], bool, Optional[Sequence[str]]) -> dict
+        """
+        Get a single document. Every document is only fetched once per request, `cached` reads
+        additionally use the process wide document cache (if configured for the doc_type). Since
+        that may lag behind changes by other processes, pass the expected `version` or `refresh`
+        if you depend on the document being current.
+
+        Reads restricted to some `fields` (`_source` includes) bypass the caches.
+        """
+        if refresh is None:
+            refresh = self._refresh_reads
+
+        if fields is not None:
+            return self._transform(self._es.get(
+                index=index,
+                doc_type=doc_type,
+                id=id,
+                _source_include=fields,
+                **self._read_args('get', refresh)
+            ))
+
+        key = (index, doc_type, id)
+
+        # a refresh is only asked for to be up to date, so don't serve those from any cache
+        if not refresh:
+            document = self._lookup(key, cached, version)
+            if document is not None:
+                # callers may modify their documents, so only ever hand out copies
+                return deepcopy(document)
+
+        document = self._transform(self._es.get(
+            index=index,
+            doc_type=doc_type,
+            id=id,
+            **self._read_args('get', refresh)
+        ))
+
+        if self._remember(key, document, cached):
+            return deepcopy(document)
+
+        return document
+
+    def get_documents(self, index, doc_type, ids, refresh=None, cached=False, fields=None):
+        # type: (str, str, Sequence[str], Optional[bool], bool, Optional[list]) -> list
+        """
+        Get multiple documents with a single multi-get (see `get_document` for caching and
+        `fields`). The result is in order of the given `ids` and contains `None` for every
+        document that was not found.
+        """
+        if not ids:
+            return []
+
+        if refresh is None:
+            refresh = self._refresh_reads
+
+        documents = {}
+        # ids of documents that are held by a cache
+        shared = set()
+
+        if not refresh and fields is None:
+            for id in ids:
+                document = self._lookup((index, doc_type, id), cached, None)
+                if document is not None:
+                    documents[id] = document
+                    shared.add(id)
+
+        missing = [id for id in OrderedDict.fromkeys(ids) if id not in documents]
+        for id, document in self._mget(index, doc_type, missing, refresh, fields):
+            documents[id] = document
+            if fields is None and self._remember((index, doc_type, id), document, cached):
+                shared.add(id)
+
+        return [
+            deepcopy(documents[id]) if id in shared else documents.get(id)
+            for id in ids
+        ]
+
+    def _mget(self, index, doc_type, ids, refresh, fields):
+        # type: (str, str, Sequence[str], bool, Optional[list]) -> Iterator[Tuple[str, dict]]
+        """Multi-get the documents with the given `ids`, yielding those found with their id."""
+        if not ids:
+            return
+
+        read_args = self._read_args('mget', refresh)
+        if fields is not None:
+            read_args['_source_include'] = fields
+
+        response = self._es.mget(
+            index=index,
+            doc_type=doc_type,
+            body={'ids': ids},
+            **read_args
+        )
+
+        for id, document in zip(ids, response['docs']):
+            if document.get('found'):
+                yield id, self._transform(document)
+
+    def create_document(self, index, doc_type, document, id=None, refresh=False, read_back=None):
+        # type: (str, str, dict, Optional[str], bool, Optional[bool]) -> dict
         created = self._es.index(
             index=index,
             doc_type=doc_type,
@@ -97,28 +435,131 @@ class DataStore(object):
             refresh=refresh
         )
 
-        return self.get_document(index, doc_type, created['_id'])
+        self._forget(doc_type, created['_id'])
+
+        if self._read_after_write if read_back is None else read_back:
+            return self.get_document(index, doc_type, created['_id'])
+
+        return self._transform({
+            '_source': document,
+            '_id': created['_id'],
+            '_version': created['_version'],
+        })
+
+    def create_documents(self, index, doc_type, documents, refresh=False, chunk_size=500):
+        # type: (str, str, Iterable[dict], bool, int) -> Iterator[Tuple[bool, dict]]
+        """
+        Index documents through the bulk API, consuming `documents` one chunk at a time. Yields an
+        `(ok, result)` tuple per document (in order): `result` is either the created document or
+        the item ES reported the failure with.
+        """
+        documents = iter(documents)
+
+        while True:
+            # `streaming_bulk` would expand all actions up front on python 2, so chunk ourselves
+            chunk = list(islice(documents, chunk_size))
+            if not chunk:
+                break
+
+            actions = (
+                {'_index': index, '_type': doc_type, '_source': document}
+                for document in chunk
+            )
+            results = streaming_bulk(
+                self._es,
+                actions,
+                chunk_size=chunk_size,
+                raise_on_error=False,
+                raise_on_exception=False,
+                refresh=refresh,
+            )
+
+            for document, (ok, item) in zip(chunk, results):
+                result = item['index']
+
+                if ok:
+                    created = dict(document)
+                    created['_id'] = result['_id']
+                    created['_version'] = result['_version']
+
+                    yield True, created
+                else:
+                    yield False, result
 
     def delete_document(self, index, doc_type, id):
         # type: (str, str, str) -> dict
         document = self.get_document(index, doc_type, id)
 
         self._es.delete(index=index, doc_type=doc_type, id=id)
+        self._forget(doc_type, id)
 
         return document
 
-    def list_documents(self, index, doc_type, limit=100, offset=0, refresh=False):
-        # type: (str, str, int, int, boolean) -> Tuple[Sequence[dict], int]
+    @staticmethod
+    def sort_values(doc_type, document):
+        # type: (str, dict) -> list
+        """The `search_after` values to continue a listing after `document` with."""
+        return ['{}#{}'.format(doc_type, document['_id'])]
+
+    def list_documents(
+        self, index, doc_type, limit=100, offset=0, refresh=False, search_after=None, fields=None
+    ):
+        # type: (str, str, int, int, bool, Optional[list], Optional[list]) -> Tuple[list, int]
         if refresh:
-            self._es.indices.refresh(index=index)
-
-        search_response = self._es.search(index=index, doc_type=doc_type, size=limit, from_=offset)
+            self._refresh_index('list', index)
+
+        # A stable order is needed to continue listings with `search_after` (which ES only accepts
+        # with `from_=0`), so that deep pages do not have to be collected from `offset` on
+        body = {'sort': [{'_uid': 'asc'}]}
+        if search_after is not None:
+            body['search_after'] = search_after
+            offset = 0
+        if fields is not None:
+            body['_source'] = fields
+
+        search_response = self._es.search(
+            index=index,
+            doc_type=doc_type,
+            body=body,
+            size=limit,
+            from_=offset,
+        )
         hits = search_response['hits']
 
         return list(map(self._transform, hits.get('hits', []))), search_response['took']
 
-    def update_document(self, index, doc_type, id, document, refresh=False):
-        # type: (str, str, str, dict) -> dict
+    def scroll_documents(self, index, doc_type, query=None, chunk_size=500, scroll='5m'):
+        # type: (str, str, Optional[dict], int, str) -> Iterator[Tuple[Sequence[dict], int]]
+        """
+        Yield all (matching) documents in chunks of `chunk_size`, along with the effort for each.
+
+        Uses a scroll in index order, so only one chunk is held in memory at any time. The scroll
+        gets cleared when the generator is exhausted or closed.
+        """
+        search_response = self._es.search(
+            index=index,
+            doc_type=doc_type,
+            body={'query': query or {'match_all': {}}, 'sort': ['_doc']},
+            size=chunk_size,
+            scroll=scroll,
+        )
+        scroll_id = search_response.get('_scroll_id')
+
+        try:
+            while search_response['hits']['hits']:
+                yield (
+                    list(map(self._transform, search_response['hits']['hits'])),
+                    search_response['took'],
+                )
+
+                search_response = self._es.scroll(scroll_id=scroll_id, scroll=scroll)
+                scroll_id = search_response.get('_scroll_id', scroll_id)
+        finally:
+            if scroll_id:
+                self._es.clear_scroll(scroll_id=scroll_id, ignore=(404,))
+
+    def update_document(self, index, doc_type, id, document, refresh=False, read_back=None):
+        # type: (str, str, str, dict, bool, Optional[bool]) -> dict
 
         # clean metadata
         document.pop('_id', None)
@@ -142,17 +583,86 @@ class DataStore(object):
         if _version:
             update_args['version'] = _version
 
-        self._es.update(**update_args)
+        if self._read_after_write if read_back is None else read_back:
+            self._es.update(**update_args)
+            self._forget(doc_type, id)
+            return self.get_document(index, doc_type, id)
+
+        # let ES return the merged document along with the update
+        update_args['_source'] = True
+        updated = self._es.update(**update_args)
+        self._forget(doc_type, id)
+
+        return self._transform({
+            '_source': updated['get']['_source'],
+            '_id': updated['_id'],
+            '_version': updated['_version'],
+        })
+
+    def search(self, index, doc_type, body, refresh=False):
+        # type: (str, str, dict, boolean) -> SearchResult
+        """
+        Run a search with a full search `body` (query, size, sort, aggregations, ...). Highlighted
+        fragments are returned with their hits' documents as `_highlight`.
+        """
+        if refresh:
+            self._refresh_index('search', index)
+
+        return self._search_result(self._es.search(index=index, doc_type=doc_type, body=body))
 
-        return self.get_document(index, doc_type, id)
+    def multi_search(self, searches):
+        # type: (Sequence[Tuple[str, str, dict]]) -> Sequence[Union[SearchResult, dict]]
+        """
+        Run several searches (given as `(index, doc_type, body)`) with a single multi-search. The
+        results are in order of the searches, failed searches are represented by ES' error.
+        """
+        if not searches:
+            return []
 
-    def search_documents(self, index, doc_type, query, refresh=False):
-        # type: (str, str, dict, boolean) -> Tuple[Sequence[dict], int]
+        self.counters['msearch'] += 1
 
-        if refresh:
-            self._es.indices.refresh(index=index)
+        body = []
+        for index, doc_type, search_body in searches:
+            body.append({'index': index, 'type': doc_type})
+            body.append(search_body)
 
-        search_response = self._es.search(index=index, doc_type=doc_type, body={'query': query})
+        return [
+            response['error'] if 'error' in response else self._search_result(response)
+            for response in self._es.msearch(body=body)['responses']
+        ]
+
+    def _search_result(self, search_response):
+        # type: (dict) -> SearchResult
         hits = search_response['hits']
 
-        return list(map(self._transform, hits.get('hits', []))), search_response['took']
+        documents = []
+        for hit in hits.get('hits', []):
+            document = self._transform(hit)
+            if 'highlight' in hit:
+                document['_highlight'] = hit['highlight']
+            documents.append(document)
+
+        return SearchResult(
+            documents=documents,
+            total=hits['total'],
+            aggregations=search_response.get('aggregations'),
+            took=search_response['took'],
+        )
+
+    def count_documents(self, index, doc_type, query=None, aggregations=None, refresh=False):
+        # type: (str, str, Optional[dict], Optional[dict], boolean) -> SearchResult
+        """
+        Count the (matching) documents and run `aggregations` on them without fetching any hits.
+        Done as a search rather than with the count API since only the former reports the effort.
+        """
+        body = {'query': query or {'match_all': {}}, 'size': 0}
+        if aggregations:
+            body['aggs'] = aggregations
+
+        return self.search(index, doc_type, body, refresh=refresh)
+
+    def search_documents(self, index, doc_type, query, refresh=False):
+        # type: (str, str, dict, boolean) -> Tuple[Sequence[dict], int]
+        result = self.search(index, doc_type, {'query': query}, refresh=refresh)
+
+        return result.documents, result.took
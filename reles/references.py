@@ -3,6 +3,10 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
 
+# added to documents by the datastore, not part of their source
+_META_FIELDS = frozenset(['_id', '_version', '_highlight'])
+
+
 def resolve_field_reference(path, parent_entity, full_entity):
     """Handle 'paths' to subfields."""
     prefix, level = _split_path(path)
@@ -33,6 +37,46 @@ def assign_to_field_reference(path, document, values):
         document[level] = values[i]
 
 
+def select_field_references(paths, document):
+    """
+    Reduce a document to the fields referenced by the paths (as ES `_source` includes would),
+    descending into lists of sub-documents. Metadata (like `_id`) is always kept.
+    """
+    # nested dicts of the selected fields, `None` selects a field as a whole
+    tree = {}
+    for path in paths:
+        prefix, last = _split_path(path)
+
+        level = tree
+        for field in prefix:
+            if field in level and level[field] is None:
+                # an ancestor is selected as a whole already
+                break
+            level = level.setdefault(field, {})
+        else:
+            level[last] = None
+
+    return _select_levels(document, tree)
+
+
+def _select_levels(document, tree):
+    if tree is None:
+        return document
+
+    if isinstance(document, list):
+        return [_select_levels(item, tree) for item in document]
+
+    if not isinstance(document, dict):
+        # e.g. a foreign key that could not be embedded
+        return document
+
+    return {
+        field: value if field in _META_FIELDS else _select_levels(value, tree[field])
+        for field, value in document.items()
+        if field in tree or field in _META_FIELDS
+    }
+
+
 def _split_path(path):
     fields = path.split('.')
     return fields[:-1], fields[-1]
@@ -49,10 +93,11 @@ def _descend_through_levels(document, levels):
             except KeyError:
                 continue
 
+            # anything but (lists of) documents has no fields to descend into, e.g. a foreign key
+            # that could not be embedded
             if isinstance(next_level, list):
-                for new_doc in next_level:
-                    temp.append(new_doc)
-            else:
+                temp.extend(new_doc for new_doc in next_level if isinstance(new_doc, dict))
+            elif isinstance(next_level, dict):
                 temp.append(next_level)
         current_level = temp
 
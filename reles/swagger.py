@@ -53,6 +53,25 @@ def _build_paths(index, definitions):
                 'description': 'list all {}::{} documents'.format(index, doc_type),
                 'responses': _get_responses(index, doc_type, collection=True),
                 'tags': [index, doc_type],
+                'parameters': [
+                    {
+                        'name': 'limit',
+                        'in': 'query',
+                        'description': 'maximum number of documents per page',
+                        'required': False,
+                        'type': 'integer',
+                        'minimum': 1
+                    },
+                    {
+                        'name': 'cursor',
+                        'in': 'query',
+                        'description': 'continue listing after the previous page '
+                                       '(from the `next` link of its response)',
+                        'required': False,
+                        'type': 'string'
+                    },
+                    {'$ref': '#/parameters/fields'}
+                ]
             },
             'post': {
                 'description': 'create a new {}::{} document'.format(index, doc_type),
@@ -76,6 +95,9 @@ def _build_paths(index, definitions):
                 'description': 'retrieve a single {}::{} document'.format(index, doc_type),
                 'responses': _get_responses(index, doc_type),
                 'tags': [index, doc_type],
+                'parameters': [
+                    {'$ref': '#/parameters/fields'}
+                ]
             },
             'put': {
                 'description': 'update a single {}::{} document'.format(index, doc_type),
@@ -111,6 +133,107 @@ def _build_paths(index, definitions):
                 }]
             }
         }
+        count_responses = {
+            '200': {
+                'description': 'number (and aggregations) of matching {}::{} documents'.format(
+                    index, doc_type
+                ),
+                'schema': {
+                    '$ref': '#/definitions/countResult'
+                }
+            },
+            '401': {'$ref': '#/responses/unauthorized'},
+            '403': {'$ref': '#/responses/forbidden'},
+            'default': {'$ref': '#/responses/genericError'}
+        }
+        output['/{}/{}/_count'.format(index, doc_type)] = {
+            'get': {
+                'description': 'count all {}::{} documents'.format(index, doc_type),
+                'responses': count_responses,
+                'tags': [index, doc_type],
+            },
+            'post': {
+                'description': 'count and aggregate matching {}::{} documents'.format(
+                    index, doc_type
+                ),
+                'responses': count_responses,
+                'tags': [index, doc_type],
+                'parameters': [{
+                    'name': 'body',
+                    'in': 'body',
+                    'required': False,
+                    'schema': {
+                        '$ref': '#/definitions/query'
+                    }
+                }]
+            }
+        }
+        output['/{}/{}/_bulk'.format(index, doc_type)] = {
+            'post': {
+                'description': 'create {}::{} documents from newline delimited JSON'.format(
+                    index, doc_type
+                ),
+                'consumes': ['application/x-ndjson'],
+                'responses': {
+                    '200': {
+                        'description': 'status of each {}::{} document'.format(index, doc_type),
+                        'schema': {
+                            '$ref': '#/definitions/bulkReport'
+                        }
+                    },
+                    '401': {'$ref': '#/responses/unauthorized'},
+                    '403': {'$ref': '#/responses/forbidden'},
+                    'default': {'$ref': '#/responses/genericError'}
+                },
+                'tags': [index, doc_type],
+                'parameters': [{
+                    'name': 'body',
+                    'in': 'body',
+                    'required': True,
+                    'schema': {
+                        'type': 'string'
+                    }
+                }]
+            }
+        }
+        output['/{}/{}/_mget'.format(index, doc_type)] = {
+            'post': {
+                'description': 'retrieve multiple {}::{} documents by id'.format(index, doc_type),
+                'responses': _get_responses(index, doc_type, collection=True),
+                'tags': [index, doc_type],
+                'parameters': [
+                    {
+                        'name': 'body',
+                        'in': 'body',
+                        'required': True,
+                        'schema': {
+                            '$ref': '#/definitions/ids'
+                        }
+                    },
+                    {'$ref': '#/parameters/fields'}
+                ]
+            }
+        }
+        output['/{}/{}/_export'.format(index, doc_type)] = {
+            'get': {
+                'description': 'export all {}::{} documents as newline delimited JSON'.format(
+                    index, doc_type
+                ),
+                'produces': ['application/x-ndjson'],
+                'responses': {
+                    '200': {
+                        'description': 'one {}::{} document per line'.format(index, doc_type),
+                        'schema': {
+                            'type': 'string'
+                        }
+                    },
+                    '401': {'$ref': '#/responses/unauthorized'},
+                    '403': {'$ref': '#/responses/forbidden'},
+                    'default': {'$ref': '#/responses/genericError'}
+                },
+                'tags': [index, doc_type],
+            }
+        }
         output['/{}/{}/{{id}}/_archive'.format(index, doc_type)] = {
             'parameters': [
                 {'$ref': '#/parameters/id'},
@@ -150,6 +273,50 @@ def _build_definitions(definitions):
             }
         }
     }
+    result['bulkReport'] = {
+        'type': 'object',
+        'properties': {
+            'errors': {'type': 'boolean'},
+            'items': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'required': [
+                        'status',
+                    ],
+                    'properties': {
+                        'status': {'type': 'integer'},
+                        '_id': {'type': 'string'},
+                        '_version': {'type': 'integer'},
+                        'error': {},
+                    }
+                }
+            }
+        }
+    }
+    result['countResult'] = {
+        'type': 'object',
+        'required': [
+            'total',
+        ],
+        'properties': {
+            'total': {'type': 'integer'},
+            'aggregations': {'type': 'object'},
+        }
+    }
+    result['ids'] = {
+        'type': 'object',
+        'required': [
+            'ids',
+        ],
+        'properties': {
+            'ids': {
+                'type': 'array',
+                'items': {'type': 'string'},
+                'minItems': 1
+            }
+        }
+    }
     result['query'] = {
         'type': 'object',
         'description': 'an Elasticsearch [query](https://www.elastic.co/guide/en/elasticsearch/reference/current/query-dsl.html)',
@@ -157,8 +324,16 @@ def _build_definitions(definitions):
             'query',
         ],
         'properties': {
-            'query': {'type': 'object'}
-        }
+            'query': {'type': 'object'},
+            'from': {'type': 'integer', 'minimum': 0},
+            'size': {'type': 'integer', 'minimum': 0},
+            'sort': {},
+            '_source': {},
+            'aggs': {'type': 'object'},
+            'aggregations': {'type': 'object'},
+            'highlight': {'type': 'object'},
+        },
+        'additionalProperties': False
     }
 
     return result
@@ -172,6 +347,15 @@ def _build_parameters():
             'description': 'id of document',
             'required': True,
             'type': 'string'
+        },
+        'fields': {
+            'name': 'fields',
+            'in': 'query',
+            'description': 'only return these (comma separated) fields of the documents',
+            'required': False,
+            'type': 'array',
+            'items': {'type': 'string'},
+            'collectionFormat': 'csv'
         }
     }
 
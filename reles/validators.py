@@ -5,8 +5,9 @@ from __future__ import (
     unicode_literals,
 )
 
-from collections import Iterable
-from functools import reduce
+from collections import Hashable, Iterable, OrderedDict, deque
+from copy import copy
+from functools import partial, reduce
 import operator
 
 from elasticsearch.exceptions import NotFoundError
@@ -14,9 +15,11 @@ from elasticsearch_dsl import Q
 from flask import current_app as app
 from geopy.distance import Point, distance
 from jsonschema import ValidationError
-from jsonschema.validators import Draft4Validator, extend
+from jsonschema.validators import Draft4Validator, RefResolver, extend
 from pathlib2 import Path
 
+from .persistence import DefinitionRegistry
+
 
 def _required(validator, ref, instance, schema):
     for field in ref:
@@ -32,19 +35,66 @@ def _required(validator, ref, instance, schema):
 
 
 def _fkey(validator, ref, instance, schema):
-    index = ref['index']
-    doc_type = ref['doc_type']
+    if not isinstance(instance, Hashable):
+        yield ValidationError('Invalid foreign key: {}'.format(instance))
+        return
 
-    try:
-        validator.datastore.get_document(index, doc_type, instance)
-    except NotFoundError:
-        yield ValidationError(
-            'Invalid foreign key: no such document {}/{}/{}'.format(
+    references = validator.fkey_references
+    if references is None:
+        # not collecting, so check right away (`iter_errors` adds where the error occurred)
+        references = OrderedDict()
+        _collect_fkey(references, ref, instance, schema, deque(), deque())
+
+        for error in _check_fkeys(validator, references):
+            yield error
+    else:
+        # checked in bulk once the whole document has been traversed, so remember where we are
+        path, schema_path = validator.location()
+        schema_path.append('x-fkey' if 'x-fkey' in schema else 'fkey')
+
+        _collect_fkey(references, ref, instance, schema, path, schema_path)
+
+
+def _collect_fkey(references, ref, instance, schema, path, schema_path):
+    target = (ref['index'], ref['doc_type'])
+    references.setdefault(target, OrderedDict()).setdefault(instance, []).append(
+        (ref, schema, path, schema_path)
+    )
+
+
+def _check_fkeys(validator, references):
+    # type: (CustomDraft4Validator, Mapping[Tuple[str, str], Mapping[str, list]]) -> Iterator
+    """Look up all collected foreign keys with a single multi-get per (index, doc_type)."""
+    for (index, doc_type), instances in references.items():
+        try:
+            documents = validator.datastore.get_documents(
                 index,
                 doc_type,
-                instance
+                list(instances.keys()),
+                cached=True
             )
-        )
+        except NotFoundError:
+            # the index (or alias) does not exist, so neither does any of the documents
+            documents = [None] * len(instances)
+
+        for (instance, occurrences), document in zip(instances.items(), documents):
+            if document is not None:
+                continue
+
+            for ref, schema, path, schema_path in occurrences:
+                yield ValidationError(
+                    'Invalid foreign key: no such document {}/{}/{}'.format(
+                        index,
+                        doc_type,
+                        instance
+                    ),
+                    validator='x-fkey',
+                    validator_value=ref,
+                    instance=instance,
+                    schema=schema,
+                    path=path,
+                    schema_path=schema_path,
+                )
 
 
 def _unique(validator, ref, instance, schema):
@@ -201,8 +251,40 @@ validators = {
 
 _CustomDraft4Validator = extend(Draft4Validator, validators, str('draft4'))
 
+# keywords which descend into sub-schemas (and are added to the `schema_path` of errors)
+_DESCENDING_KEYWORDS = frozenset([
+    'additionalItems',
+    'additionalProperties',
+    'allOf',
+    'anyOf',
+    'dependencies',
+    'items',
+    'not',
+    'oneOf',
+    'patternProperties',
+    'properties',
+])
+
+
+def _tracking(keyword, validate):
+    """Wrap a keyword's validator function to record descending through it (see `location`)."""
+    def tracked(validator, value, instance, schema):
+        validator._descents.append((None, keyword))
+        try:
+            for error in validate(validator, value, instance, schema) or ():
+                yield error
+        finally:
+            validator._descents.pop()
+
+    return tracked
+
 
 class CustomDraft4Validator(_CustomDraft4Validator):
+    VALIDATORS = {
+        keyword: _tracking(keyword, validate) if keyword in _DESCENDING_KEYWORDS else validate
+        for keyword, validate in _CustomDraft4Validator.VALIDATORS.items()
+    }
+
     def __init__(self, *args, **kwargs):
         self.datastore = kwargs.pop('datastore')
         self.upload_path = kwargs.pop('upload_path')
@@ -210,4 +292,80 @@ class CustomDraft4Validator(_CustomDraft4Validator):
         self.index = kwargs.pop('index', None)
         self.doc_type = kwargs.pop('doc_type', None)
 
+        # foreign keys are collected here while a document is validated
+        self.fkey_references = None
+        # the (path, schema_path) of every keyword & `descend` leading to what is validated
+        self._descents = []
+
         super(CustomDraft4Validator, self).__init__(*args, **kwargs)
+
+    def descend(self, instance, schema, path=None, schema_path=None):
+        self._descents.append((path, schema_path))
+        try:
+            for error in super(CustomDraft4Validator, self).descend(
+                instance, schema, path, schema_path
+            ):
+                yield error
+        finally:
+            self._descents.pop()
+
+    def location(self):
+        # type: () -> Tuple[deque, deque]
+        """The path & schema path (as on `ValidationError`s) of what is currently validated."""
+        return (
+            deque(path for path, _ in self._descents if path is not None),
+            deque(schema_path for _, schema_path in self._descents if schema_path is not None),
+        )
+
+    def iter_errors(self, instance, _schema=None):
+        if _schema is not None:
+            # descending into a sub-schema
+            for error in super(CustomDraft4Validator, self).iter_errors(instance, _schema):
+                yield error
+            return
+
+        self.fkey_references = OrderedDict()
+        self._descents = []
+        try:
+            for error in super(CustomDraft4Validator, self).iter_errors(instance, _schema):
+                yield error
+
+            for error in _check_fkeys(self, self.fkey_references):
+                yield error
+        finally:
+            self.fkey_references = None
+
+    def bind(self, index=None, doc_type=None):
+        # type: (str, str) -> CustomDraft4Validator
+        """
+        Create a copy of this validator for a single request: the schema (and the resolver's
+        caches) are shared, request specific state like the `index` is set on the copy.
+        """
+        bound = copy(self)
+        bound.index = index
+        bound.doc_type = doc_type
+
+        # the resolver maintains a scope stack while validating, so it must not be shared
+        bound.resolver = RefResolver(
+            self.resolver.resolution_scope,
+            self.resolver.referrer,
+            store=self.resolver.store,
+            urljoin_cache=self.resolver._urljoin_cache,
+            remote_cache=self.resolver._remote_cache,
+        )
+
+        return bound
+
+
+class ValidatorRegistry(DefinitionRegistry):
+    """
+    Holds a compiled `CustomDraft4Validator` per (endpoint, doc_type), so they do not have to be
+    built for every request.
+    """
+
+    def __init__(self, schemastore, datastore, upload_path):
+        # type: (SwaggerSchemaStore, DataStore, str) -> None
+        super(ValidatorRegistry, self).__init__(
+            schemastore,
+            partial(CustomDraft4Validator, datastore=datastore, upload_path=upload_path),
+        )
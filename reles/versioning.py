@@ -7,13 +7,32 @@ from __future__ import (
     unicode_literals,
 )
 
+from Queue import Empty, Full, Queue
+from collections import Counter
+from contextlib import contextmanager
+import errno
+import fcntl
+import io
+import json
+import os
+from threading import Event, Lock, Thread
+
 import elasticsearch_dsl as dsl
+from flask import current_app, has_app_context
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy.exc import IntegrityError, StatementError
+from sqlalchemy.exc import (
+    DBAPIError,
+    DisconnectionError,
+    IntegrityError,
+    InterfaceError,
+    OperationalError,
+    SQLAlchemyError,
+    StatementError,
+)
 from sqlalchemy.schema import CheckConstraint, Index, PrimaryKeyConstraint
 from sqlalchemy.sql.functions import func
 
-from .database import db
+from .database import JSONEncoder, db
 
 
 class VersioningException(Exception):
@@ -61,8 +80,260 @@ class ArchivingDocType(dsl.DocType):
         return result
 
 
-def archive_document_version(doc_type, pk, version, document):
-    # type: (str, str, int, dict) -> void
+class VersionArchiver(object):
+    """
+    Archive document versions behind the requests' backs: versions are queued (at most
+    `max_size`) and inserted in batches of up to `flush_threshold` rows every `flush_interval`
+    seconds, as soon as `flush_threshold` versions are pending, and when the archiver is stopped.
+
+    Producers block for up to `put_timeout` seconds while the queue is full. Versions that still
+    do not fit, and batches that cannot be inserted because Postgres is unavailable, are appended
+    to the `spill_path` file (one JSON array per line), which is replayed once inserting works
+    again. Rows that fail for any other reason (e.g. violated constraints or invalid data) are
+    logged and dropped, as nobody is waiting for them and retrying them would fail forever.
+
+    The spill file may be shared by several processes (e.g. gunicorn workers): appending to it
+    and replaying it are serialized by `flock`s on `.lock` files next to it.
+    """
+
+    def __init__(
+        self,
+        app,
+        spill_path,
+        max_size=10000,
+        flush_interval=1,
+        flush_threshold=500,
+        put_timeout=1,
+    ):
+        # type: (flask.app.Flask, str, int, float, int, float) -> None
+        if not spill_path:
+            raise ValueError('Archiving versions behind the requests needs a spill file')
+
+        self._app = app
+        self._spill_path = spill_path
+        self._flush_threshold = flush_threshold
+        self._flush_interval = flush_interval
+        self._put_timeout = put_timeout
+
+        self._queue = Queue(maxsize=max_size)
+        self._spill_lock = Lock()
+        # serializes flushes of the worker, of full queues & of `stop`
+        self._flush_lock = Lock()
+
+        self._flush_requested = Event()
+        self._stopped = Event()
+        self._thread = None
+
+        self.counters = Counter()
+
+    def start(self):
+        # type: () -> None
+        self._thread = Thread(target=self._run, name='version-archiver')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        # type: () -> None
+        """Stop flushing periodically and flush what is pending."""
+        self._stopped.set()
+        self._flush_requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self._flush_interval)
+            self._flush_requested.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                self._app.logger.exception('Failed to flush document versions')
+
+    def archive(self, versions):
+        # type: (Sequence[Tuple[str, str, int, dict]]) -> None
+        """Queue `(doc_type, pk, version, document)` tuples for archiving."""
+        for position, version in enumerate(versions):
+            try:
+                self._queue.put(version, timeout=self._put_timeout)
+            except Full:
+                self.counters['overflows'] += 1
+                self._spill(versions[position:])
+                break
+
+        if self._queue.qsize() >= self._flush_threshold:
+            self._flush_requested.set()
+
+    def flush(self):
+        # type: () -> None
+        with self._flush_lock:
+            healthy = True
+
+            while True:
+                batch = []
+                try:
+                    while len(batch) < self._flush_threshold:
+                        batch.append(self._queue.get_nowait())
+                except Empty:
+                    pass
+
+                if not batch:
+                    break
+
+                healthy = self._insert(batch) and healthy
+
+            if healthy:
+                self._replay()
+
+    def _insert(self, batch):
+        # type: (Sequence[Tuple[str, str, int, dict]]) -> bool
+        """Insert the batch, returns whether Postgres was available."""
+        self.counters['flushes'] += 1
+
+        with self._app.app_context():
+            try:
+                _insert_versions(batch)
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                if not _is_unavailable(error):
+                    # find (and drop) the offending rows
+                    return self._insert_one_by_one(batch)
+
+                self._app.logger.warning(
+                    'Failed to archive %d document versions, spilling them: %s', len(batch), error
+                )
+                self._spill(batch)
+                return False
+
+        self.counters['archived'] += len(batch)
+        return True
+
+    def _insert_one_by_one(self, batch):
+        # type: (Sequence[Tuple[str, str, int, dict]]) -> bool
+        for position, version in enumerate(batch):
+            try:
+                _insert_versions([version])
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                if _is_unavailable(error):
+                    self._spill(batch[position:])
+                    return False
+
+                # retrying a row that fails permanently (constraints, bad data) is pointless
+                self.counters['dropped'] += 1
+                self._app.logger.warning(
+                    'Dropping version %d of %s `%s`: %s', version[2], version[0], version[1], error
+                )
+            else:
+                self.counters['archived'] += 1
+
+        return True
+
+    def _spill(self, versions):
+        # type: (Sequence[Tuple[str, str, int, dict]]) -> None
+        encoder = JSONEncoder()
+
+        with self._spill_lock, _file_lock(self._spill_path + '.lock'):
+            with io.open(self._spill_path, 'ab') as spill:
+                for version in versions:
+                    spill.write(encoder.encode(list(version)).encode('utf-8') + b'\n')
+
+                spill.flush()
+                os.fsync(spill.fileno())
+
+        self.counters['spilled'] += len(versions)
+
+    def _replay(self):
+        # type: () -> None
+        """Insert the spilled versions, which are spilled again if this fails."""
+        with _file_lock(self._spill_path + '.replay.lock', blocking=False) as acquired:
+            if acquired:
+                self._replay_spilled()
+            else:
+                self._app.logger.debug('Another process is replaying %s', self._spill_path)
+
+    def _replay_spilled(self):
+        # type: () -> None
+        replay_path = self._spill_path + '.replay'
+
+        with self._spill_lock, _file_lock(self._spill_path + '.lock'):
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self._spill_path):
+                    return
+
+                # new versions get spilled to a fresh file meanwhile
+                os.rename(self._spill_path, replay_path)
+
+        batch = []
+        with io.open(replay_path, 'rb') as replay:
+            for line in replay:
+                batch.append(tuple(json.loads(line)))
+
+                if len(batch) >= self._flush_threshold:
+                    self._insert(batch)
+                    batch = []
+
+        if batch:
+            self._insert(batch)
+
+        self.counters['replays'] += 1
+        os.remove(replay_path)
+
+
+def _is_unavailable(error):
+    # type: (SQLAlchemyError) -> bool
+    """Whether `error` means Postgres is unreachable (for now) rather than a row being bad."""
+    if isinstance(error, (DisconnectionError, InterfaceError, OperationalError)):
+        return True
+
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    # type: (str, bool) -> Iterator[bool]
+    """Hold an exclusive `flock` on `path` (created if missing), yields whether it was acquired."""
+    with io.open(path, 'ab') as lock:
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as error:
+            if error.errno not in (errno.EACCES, errno.EAGAIN):
+                raise
+
+            yield False
+        else:
+            yield True
+
+
+def _version_archiver():
+    # type: () -> Optional[VersionArchiver]
+    return getattr(current_app, 'version_archiver', None) if has_app_context() else None
+
+
+def _insert_versions(versions):
+    # type: (Sequence[Tuple[str, str, int, dict]]) -> None
+    """Insert `(doc_type, pk, version, document)` tuples with a single multi-row INSERT."""
+    rows = [
+        {'doc_type': doc_type, 'id': pk, 'version': version, 'document': document}
+        for doc_type, pk, version, document in versions
+    ]
+
+    db.session.execute(DocumentVersion.__table__.insert().values(rows))
+    db.session.commit()
+
+
+def archive_document_version(doc_type, pk, version, document, synchronous=False):
+    # type: (str, str, int, dict, bool) -> Optional[DocumentVersion]
+    """
+    Archive a version of a document, queued for the `VersionArchiver` if the app has one (unless
+    `synchronous`).
+    """
+    archiver = _version_archiver()
+    if archiver is not None and not synchronous:
+        return archiver.archive([(doc_type, pk, version, document)])
 
     # TODO route to different tables based on doc_type?
     document_version = DocumentVersion(
@@ -82,6 +353,27 @@ def archive_document_version(doc_type, pk, version, document):
         return document_version
 
 
+def archive_document_versions(versions, synchronous=False):
+    # type: (Sequence[Tuple[str, str, int, dict]], bool) -> void
+    """
+    Archive many `(doc_type, pk, version, document)` tuples with a single multi-row INSERT,
+    queued for the `VersionArchiver` if the app has one (unless `synchronous`).
+    """
+
+    if not versions:
+        return
+
+    archiver = _version_archiver()
+    if archiver is not None and not synchronous:
+        return archiver.archive(versions)
+
+    try:
+        _insert_versions(versions)
+    except (IntegrityError, StatementError) as e:
+        db.session.rollback()
+        raise VersioningException(e)
+
+
 def retrieve_document_version(doc_type, pk, version):
     # type: (str, str, int) -> dict
 
@@ -92,7 +384,9 @@ def retrieve_document_version(doc_type, pk, version):
     if document_version:
         return document_version.document
     else:
-        raise VersioningException('There is no version {} of {} \'{}\''.format(version, doc_type, pk))
+        raise VersioningException(
+            'There is no version {} of {} \'{}\''.format(version, doc_type, pk)
+        )
 
 
 def list_document_versions(doc_type, pk):
@@ -1,20 +1,28 @@
 from __future__ import absolute_import, print_function
 
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import Counter, deque
 from hashlib import sha1
 import httplib
+from itertools import chain
+import json
 from urlparse import urljoin
+import zlib
 
 from elasticsearch import NotFoundError, TransportError
 from elasticsearch_dsl import Index
 from flask import (
+    Response,
     current_app,
     g,
     jsonify,
     make_response,
     request,
     send_from_directory,
-    url_for
+    stream_with_context,
+    url_for,
 )
+from flask import json as flask_json
 from geopy.exc import GeocoderServiceError
 from jsonschema import ValidationError
 import magic
@@ -23,66 +31,177 @@ from pathlib2 import Path
 from werkzeug.exceptions import BadRequest
 
 from . import auth
-from .auth.aliases import AliasType, translate_index, unalias
+from .auth.aliases import (
+    AliasType,
+    is_single_name,
+    permitted_alias,
+    translate_index,
+    unalias,
+)
 from .auth.models import Customer
-from .modificators import Processor
-from .references import assign_to_field_reference, resolve_field_reference
+from .persistence import SearchResult
+from .references import (
+    assign_to_field_reference,
+    resolve_field_reference,
+    select_field_references,
+)
 from .swagger import build_swagger_json
-from .validators import CustomDraft4Validator, is_valid_address
+from .validators import is_valid_address
 from .versioning import (
     VersioningException,
     archive_document_version,
+    archive_document_versions,
     list_document_versions,
     retrieve_document_version,
 )
 
+# Options that may be passed on to ES in a search body, anything else is rejected
+_SEARCH_BODY_KEYS = frozenset([
+    'query',
+    'from',
+    'size',
+    'sort',
+    '_source',
+    'aggs',
+    'aggregations',
+    'highlight',
+])
+
+# Options of a count body
+_COUNT_BODY_KEYS = frozenset([
+    'query',
+    'aggs',
+    'aggregations',
+])
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+class PaginationError(Exception):
+    pass
+
+
+class QueryError(Exception):
+    pass
+
 
 def error_response(code, message, errors=None):
     return jsonify({'message': message, 'errors': errors}), code
 
 
-# TODO cache validator instances
 def _validator(index, doc_type):
     # type: (str, str) -> CustomDraft4Validator
 
-    datastore = current_app.datastore
-    schemastore = current_app.schemastore
+    validators = current_app.validators
 
-    upload_path = current_app.config['UPLOAD_MNT']
-
-    schema = schemastore.get_schema(index, doc_type)
-    if not schema:
+    validator = validators.get(index, doc_type)
+    if validator is None:
         # try undoing the index aliasing we do for customer permissions
         _index, _, _ = unalias(index)
-        schema = schemastore.get_schema(_index, doc_type)
+        validator = validators.get(_index, doc_type)
 
-    if not schema:
+    if validator is None:
         # we have no schema to validate against
-        raise ValidationError('There is no schema for {}/{}'.format(_index, doc_type))
+        raise ValidationError('There is no schema for {}/{}'.format(index, doc_type))
 
-    return CustomDraft4Validator(
-        schema,
-        datastore=datastore,
-        upload_path=upload_path,
-        index=index,
-        doc_type=doc_type
-    )
+    return validator.bind(index=index, doc_type=doc_type)
 
 
-# TODO cache processor instances
 def _processor(index, doc_type):
     # type: (str, str) -> Processor
 
-    datastore = current_app.datastore
-    schemastore = current_app.schemastore
+    processors = current_app.processors
 
-    schema = schemastore.get_schema(index, doc_type)
-    if not schema:
+    processor = processors.get(index, doc_type)
+    if processor is None:
         # try undoing the index aliasing we do for customer permissions
         _index, _, _ = unalias(index)
-        schema = schemastore.get_schema(_index, doc_type)
+        processor = processors.get(_index, doc_type)
+
+    if processor is None:
+        raise ValidationError('There is no schema for {}/{}'.format(index, doc_type))
+
+    return processor
+
+
+def _encode_cursor(sort_values):
+    # type: (list) -> str
+    return urlsafe_b64encode(json.dumps(sort_values, separators=(',', ':')))
+
+
+def _decode_cursor(cursor):
+    # type: (str) -> list
+    try:
+        sort_values = json.loads(urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError):
+        raise PaginationError('invalid cursor')
+
+    if not isinstance(sort_values, list):
+        raise PaginationError('invalid cursor')
+
+    return sort_values
+
+
+def _get_limit():
+    # type: () -> int
+    limit = request.args.get('limit', current_app.config['LIST_DEFAULT_LIMIT'])
+    max_limit = current_app.config['LIST_MAX_LIMIT']
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
 
-    return Processor(schema, datastore=datastore)
+    if not 0 < limit <= max_limit:
+        raise PaginationError('limit must be between 1 and {}'.format(max_limit))
+
+    return limit
+
+
+def _next_page_link(cursor):
+    # type: (str) -> str
+    """`Link` header value for the page following the current request's, continuing at `cursor`."""
+    args = request.args.to_dict(flat=False)
+    args['cursor'] = cursor
+    args.update(request.view_args)
+
+    return '<{}>; rel="next"'.format(url_for(request.endpoint, _external=True, **args))
+
+
+def _list_page(index, doc_type, refresh, fields):
+    # type: (str, str, bool, Optional[list]) -> Tuple[list, int, Optional[str]]
+    """
+    Read the page of documents requested by the `limit` and `cursor` URL parameters. Returns the
+    documents, the effort and the cursor of the next page (`None` for the last one).
+    """
+    datastore = current_app.datastore
+
+    limit = _get_limit()
+    cursor = request.args.get('cursor')
+    search_after = _decode_cursor(cursor) if cursor else None
+
+    try:
+        documents, effort = datastore.list_documents(
+            index=index,
+            doc_type=doc_type,
+            limit=limit,
+            refresh=refresh,
+            search_after=search_after,
+            fields=fields,
+        )
+    except TransportError as error:
+        if isinstance(error, NotFoundError) or error.status_code != httplib.BAD_REQUEST:
+            raise
+        # ES rejected the `search_after` values from the cursor
+        raise PaginationError('invalid cursor')
+
+    if len(documents) < limit:
+        return documents, effort, None
+
+    # Sort values of the last document, before embedding replaces anything in it
+    return documents, effort, _encode_cursor(datastore.sort_values(doc_type, documents[-1]))
 
 
 @translate_index(AliasType.read)
@@ -90,21 +209,34 @@ def list_documents(index, doc_type):
     # type: (str, str) -> flask.app.Response
     refresh = request.args.get('refresh', False)
 
-    datastore = current_app.datastore
+    source, selected = _requested_fields()
 
     try:
-        documents, effort = datastore.list_documents(index=index, doc_type=doc_type, refresh=refresh)
+        documents, effort, next_cursor = _list_page(index, doc_type, refresh, source)
+    except PaginationError as error:
+        return error_response(httplib.BAD_REQUEST, error.message)
     except NotFoundError:
-        # The endpoint is configured (otherwise auth would have intervened) but the index does not exist?
+        # The endpoint is configured (otherwise auth would have intervened) but the index does
+        # not exist?
         return error_response(httplib.INTERNAL_SERVER_ERROR, 'configured index not found')
 
+    try:
+        _embed_requested_documents(index, doc_type, documents)
+    except EmbeddingError as error:
+        return error_response(httplib.BAD_REQUEST, error.message)
+
+    documents = _select_fields(selected, documents)
+
     try:
         # Only charge valid requests
         Customer.charge_cycles(g.customer['_id'], index, effort)
     except auth.NotFoundError as error:
         return error_response(httplib.UNAUTHORIZED, error.error)
     else:
-        return jsonify(documents)
+        response = jsonify(documents)
+        if next_cursor:
+            response.headers['Link'] = _next_page_link(next_cursor)
+        return response
 
 
 @translate_index(AliasType.write)
@@ -145,88 +277,445 @@ def create_document(index, doc_type):
     return jsonify(created), 201
 
 
+def _charge_crud(index, refresh, count=1):
+    # type: (str, bool, int) -> None
+    """Charge the customer for `count` CRUD operations on `index`, more if they refresh it."""
+    factor = current_app.config['CYCLES_FACTOR_REFRESH'] if refresh else 1
+    Customer.charge_cycles(
+        g.customer['_id'],
+        index,
+        count * factor * current_app.config['CYCLES_CRUD']
+    )
+
+
+def _bulk_documents(lines, validator, processor, items, pending):
+    # type: (Iterable[str], CustomDraft4Validator, Processor, list, deque) -> Iterator[dict]
+    """
+    Validate and process the documents of newline delimited JSON `lines`. Every line gets its
+    position in `items`, invalid ones are reported there right away, while the positions of the
+    documents yielded are appended to `pending`.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            processed = _bulk_document(line, validator, processor)
+        except ValidationError as e:
+            items.append({'status': 400, 'error': e.message})
+            continue
+
+        pending.append(len(items))
+        items.append(None)
+        yield processed
+
+
+def _bulk_document(line, validator, processor):
+    # type: (str, CustomDraft4Validator, Processor) -> dict
+    try:
+        document = json.loads(line)
+    except ValueError:
+        raise ValidationError('Failed to parse line as JSON')
+
+    if not document:
+        raise ValidationError('no document provided')
+
+    validator.validate(document)
+    return processor.process(document)
+
+
+@translate_index(AliasType.write)
+def bulk_create_documents(index, doc_type):
+    # type: (str, str) -> flask.Response
+    """
+    Create documents from a body of newline delimited JSON. Every line is validated and processed
+    on its own, the results are reported per line (in order) in `items`.
+    """
+    refresh = request.args.get('refresh', False)
+
+    datastore = current_app.datastore
+    chunk_size = current_app.config['BULK_CHUNK_SIZE']
+
+    try:
+        validator = _validator(index, doc_type)
+    except ValidationError as e:
+        return error_response(400, e.message)
+
+    processor = _processor(index, doc_type)
+
+    # Cycles are charged once all documents are written, but don't write anything for an
+    # invalid customer
+    if not Customer.exists(g.customer['_id']):
+        return error_response(httplib.UNAUTHORIZED, 'Invalid customer')
+
+    items = []
+    # positions in `items` of the documents passed on to the datastore
+    pending = deque()
+
+    created = 0
+    versions = []
+
+    for ok, result in datastore.create_documents(
+        index=index,
+        doc_type=doc_type,
+        documents=_bulk_documents(request.stream, validator, processor, items, pending),
+        refresh=refresh,
+        chunk_size=chunk_size
+    ):
+        position = pending.popleft()
+
+        if ok:
+            created += 1
+            items[position] = {'status': 201, '_id': result['_id'], '_version': result['_version']}
+            versions.append((doc_type, result['_id'], result['_version'], result))
+        else:
+            items[position] = {'status': result.get('status', 500), 'error': result.get('error')}
+
+        if len(versions) >= chunk_size:
+            archive_document_versions(versions)
+            versions = []
+
+    archive_document_versions(versions)
+
+    if created:
+        try:
+            _charge_crud(index, refresh, created)
+        except auth.NotFoundError as error:
+            return error_response(httplib.UNAUTHORIZED, error.error)
+
+    return jsonify({
+        'errors': created != len(items),
+        'items': items,
+    })
+
+
+def _export_lines(index, doc_type, customer_id, first, chunks, gzipped):
+    # type: (str, str, str, Optional[tuple], Generator[tuple, None, None], bool) -> Iterator[str]
+    """
+    Encode the `first` chunk of documents and the remaining `chunks` as newline delimited JSON,
+    charging the customer chunk by chunk. The `chunks` are closed once done, even if aborted.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if gzipped else None
+
+    try:
+        for documents, effort in chain([first] if first else [], chunks):
+            Customer.charge_cycles(customer_id, index, effort)
+
+            data = ''.join(flask_json.dumps(document) + '\n' for document in documents)
+            data = data.encode('utf-8')
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    except auth.NotFoundError as error:
+        # Too late for an error response, the client will notice the missing end of the stream
+        current_app.logger.warning('Aborted export of %s/%s: %s', index, doc_type, error.error)
+        return
+    finally:
+        chunks.close()
+
+    if compressor:
+        yield compressor.flush()
+
+
+@translate_index(AliasType.read)
+def export_documents(index, doc_type):
+    # type: (str, str) -> flask.Response
+    """
+    Stream all documents as newline delimited JSON, gzipped if the client accepts it. Documents
+    are read (and cycles charged) in chunks, so only one chunk is ever held in memory.
+    """
+    datastore = current_app.datastore
+    customer_id = g.customer['_id']
+
+    if not Customer.exists(customer_id):
+        return error_response(httplib.UNAUTHORIZED, 'Invalid customer')
+
+    chunks = datastore.scroll_documents(
+        index=index,
+        doc_type=doc_type,
+        chunk_size=current_app.config['EXPORT_CHUNK_SIZE'],
+    )
+
+    # Start the scroll before the response, so errors can still be reported with a status code
+    try:
+        first = next(chunks)
+    except StopIteration:
+        first = None
+    except NotFoundError:
+        # The endpoint is configured (otherwise auth would have intervened) but the index does
+        # not exist?
+        return error_response(httplib.INTERNAL_SERVER_ERROR, 'configured index not found')
+
+    gzipped = 'gzip' in request.accept_encodings
+
+    lines = _export_lines(index, doc_type, customer_id, first, chunks, gzipped)
+
+    response = Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+
+    return response
+
+
 @translate_index(AliasType.read)
 def retrieve_document(index, doc_type, id):
     # type: (str, str, str) -> flask.Response
+    # realtime GETs see the latest version anyway, so only refresh if explicitly asked to
+    refresh = request.args.get('refresh', None)
 
     datastore = current_app.datastore
 
+    source, selected = _requested_fields()
+
     try:
-        document = datastore.get_document(index=index, doc_type=doc_type, id=id)
+        document = datastore.get_document(
+            index=index,
+            doc_type=doc_type,
+            id=id,
+            refresh=refresh,
+            fields=source,
+        )
     except NotFoundError:
         return error_response(404, 'document not found')
 
-    embed_paths = request.args.getlist('embed')
-    if embed_paths:
-        endpoint, _, _ = unalias(index)
-        document = _embed_documents(endpoint, doc_type, document, embed_paths)
+    try:
+        _embed_requested_documents(index, doc_type, [document])
+    except EmbeddingError as error:
+        return error_response(httplib.BAD_REQUEST, error.message)
+
+    if selected:
+        document = select_field_references(selected, document)
 
     try:
         # Only charge the customer if there is a document to deliver
-        Customer.charge_cycles(g.customer['_id'], index, current_app.config['CYCLES_CRUD'])
+        factor = current_app.config['CYCLES_FACTOR_REFRESH'] if refresh else 1
+        Customer.charge_cycles(g.customer['_id'], index, factor * current_app.config['CYCLES_CRUD'])
     except auth.NotFoundError as error:
         return error_response(httplib.UNAUTHORIZED, error.error)
     else:
         return jsonify(document)
 
 
-def _embed_documents(index, doc_type, document, paths):
+def _requested_ids():
+    # type: () -> list
+    """The document `ids` in the body of a multi-get request."""
+    try:
+        body = request.get_json()
+    except BadRequest:
+        raise QueryError('Failed to parse request body as JSON')
+
+    ids = body.get('ids') if isinstance(body, dict) else None
+    max_ids = current_app.config['LIST_MAX_LIMIT']
+    if (
+        not isinstance(ids, list) or
+        not 0 < len(ids) <= max_ids or
+        not all(isinstance(id, basestring) and id for id in ids)
+    ):
+        raise QueryError('Expected 1 to {} document `ids`'.format(max_ids))
+
+    return ids
+
+
+@translate_index(AliasType.read)
+def retrieve_documents(index, doc_type):
+    # type: (str, str) -> flask.Response
+    """
+    Retrieve the documents with the `ids` given in the body with a single multi-get. They are
+    returned in order, documents that do not exist as `{"_id": ..., "_found": false}`.
+    """
+    refresh = request.args.get('refresh', None)
 
     datastore = current_app.datastore
+
+    try:
+        ids = _requested_ids()
+    except QueryError as error:
+        return error_response(400, error.message)
+
+    source, selected = _requested_fields()
+
+    try:
+        documents = datastore.get_documents(
+            index=index,
+            doc_type=doc_type,
+            ids=ids,
+            refresh=refresh,
+            fields=source,
+        )
+    except NotFoundError:
+        # The endpoint is configured (otherwise auth would have intervened) but the index does
+        # not exist?
+        return error_response(httplib.INTERNAL_SERVER_ERROR, 'configured index not found')
+
+    found = [document for document in documents if document is not None]
+
+    try:
+        _embed_requested_documents(index, doc_type, found)
+    except EmbeddingError as error:
+        return error_response(httplib.BAD_REQUEST, error.message)
+
+    if found:
+        try:
+            # Only charge for documents there are to deliver
+            _charge_crud(index, refresh, len(found))
+        except auth.NotFoundError as error:
+            return error_response(httplib.UNAUTHORIZED, error.error)
+
+    return jsonify([
+        {'_id': id, '_found': False} if document is None else
+        select_field_references(selected, document) if selected else document
+        for id, document in zip(ids, documents)
+    ])
+
+
+def _requested_fields():
+    # type: () -> Tuple[Optional[list], Optional[list]]
+    """
+    For the fields requested as `fields` URL parameters (comma separated or repeated), get the
+    `_source` includes to read and the fields to select after embedding, `None`s for all fields.
+    Documents are embedded as a whole, so fields within `embed` paths are read with their path.
+    """
+    fields = [
+        field
+        for value in request.args.getlist('fields')
+        for field in value.split(',')
+        if field
+    ]
+    if not fields:
+        return None, None
+
+    embed_paths = sorted(request.args.getlist('embed'), key=len)
+
+    def _within(field, path):
+        return field == path or field.startswith(path + '.')
+
+    # embedding needs the foreign keys, so they are selected unless only some fields of the
+    # embedded documents are
+    selected = fields + [
+        path for path in embed_paths if not any(_within(field, path) for field in fields)
+    ]
+
+    source = OrderedSet(
+        next((path for path in embed_paths if _within(field, path)), field)
+        for field in selected
+    )
+
+    return list(source), selected
+
+
+def _select_fields(selected, documents):
+    # type: (Optional[list], Sequence[dict]) -> Sequence[dict]
+    """Select the `selected` fields (see `_requested_fields`) of the documents, if there are any."""
+    if not selected:
+        return documents
+
+    return [select_field_references(selected, document) for document in documents]
+
+
+def _embed_requested_documents(index, doc_type, documents):
+    # type: (str, str, Sequence[dict]) -> None
+    """Embed the documents referenced by the paths given as `embed` URL parameters."""
+    embed_paths = request.args.getlist('embed')
+    if embed_paths:
+        endpoint, _, _ = unalias(index)
+        _embed_documents(endpoint, doc_type, documents, embed_paths)
+
+
+def _get_embedded_fkey(index, doc_type, path):
+    # type: (str, str, str) -> dict
+    """Get the `x-fkey` spec of the field referenced by an embed path."""
+
     schemastore = current_app.schemastore
 
-    # Process each query param
-    for path in paths:
-        properties = schemastore.get_schema(index, doc_type).get('properties', {})
-        fields = path.split('.')
+    properties = (schemastore.get_schema(index, doc_type) or {}).get('properties', {})
+    fkey_spec = {}
 
-        # Get `x-fkey` spec from nested documents
-        for field in fields:
-            field_spec = properties.get(field, {})
+    # Get `x-fkey` spec from nested documents
+    for field in path.split('.'):
+        field_spec = properties.get(field, {})
 
-            if field_spec.get('type') == 'array':
-                field_spec = field_spec.get('items', {})
+        if field_spec.get('type') == 'array':
+            field_spec = field_spec.get('items', {})
 
-            fkey_spec = field_spec.get('x-fkey', {})
+        fkey_spec = field_spec.get('x-fkey', {})
 
-            if fkey_spec:
-                properties = schemastore.get_schema(fkey_spec['index'], fkey_spec['doc_type']).get('properties', {})
-            else:
-                properties = field_spec.get('properties', {})
+        if fkey_spec:
+            properties = (
+                schemastore.get_schema(fkey_spec['index'], fkey_spec['doc_type']) or {}
+            ).get('properties', {})
+        else:
+            properties = field_spec.get('properties', {})
 
-        if not fkey_spec:
-            return error_response(
-                httplib.BAD_REQUEST,
-                'cannot embed `{}` into {}/{}/{} since it is not configured as'
-                ' an `x-fkey`'.format(path, index, doc_type, id)
-            )
+    if not fkey_spec:
+        raise EmbeddingError(
+            'cannot embed `{}` into {}/{} since it is not configured as'
+            ' an `x-fkey`'.format(path, index, doc_type)
+        )
+
+    return fkey_spec
+
+
+def _embed_documents(index, doc_type, documents, paths):
+    # type: (str, str, Sequence[dict], Sequence[str]) -> Sequence[dict]
+    """
+    Replace the foreign keys referenced by each of the `paths` with the documents they point at.
+    The referenced documents are fetched with one multi-get per path for *all* given documents,
+    references to documents that do not exist are left as they are (and nested paths skip them).
+    """
+
+    datastore = current_app.datastore
+
+    # Process each query param
+    for path in paths:
+        fkey_spec = _get_embedded_fkey(index, doc_type, path)
 
         # Get `fkey` values (singles or collections) from *all* fields referenced py the path
-        resolved_fkey_data = resolve_field_reference(path, None, document)
-
-        embedded_data = []
-        for fkey_data in resolved_fkey_data:
-            if isinstance(fkey_data, list):
-                embedded_data.append(
-                    [datastore.get_document(
-                        index=fkey_spec['index'],
-                        doc_type=fkey_spec['doc_type'],
-                        id=fkey
-                    ) for fkey in fkey_data]
+        resolved_fkey_data = [
+            resolve_field_reference(path, None, document) for document in documents
+        ]
+
+        fkeys = OrderedSet(
+            fkey
+            for fkey_data in resolved_fkey_data
+            for fkey_datum in fkey_data
+            for fkey in (fkey_datum if isinstance(fkey_datum, list) else [fkey_datum])
+        )
+
+        fetched = dict(zip(fkeys, datastore.get_documents(
+            index=fkey_spec['index'],
+            doc_type=fkey_spec['doc_type'],
+            ids=list(fkeys),
+            cached=True
+        )))
+
+        def _embed(fkey):
+            embedded = fetched.get(fkey)
+            if embedded is None:
+                current_app.logger.debug(
+                    'Not embedding missing document %s/%s/%s',
+                    fkey_spec['index'],
+                    fkey_spec['doc_type'],
+                    fkey,
                 )
+                return fkey
             else:
-                embedded_data.append(
-                    datastore.get_document(
-                        index=fkey_spec['index'],
-                        doc_type=fkey_spec['doc_type'],
-                        id=fkey_data
-                    )
-                )
+                return embedded
+
+        # Embed the retrieved documents, into those that have the (optional) foreign keys
+        for document, fkey_data in zip(documents, resolved_fkey_data):
+            if not fkey_data:
+                continue
 
-        # Embed the retrieved documents
-        assign_to_field_reference(path, document, embedded_data)
+            assign_to_field_reference(path, document, [
+                [_embed(fkey) for fkey in fkey_datum] if isinstance(fkey_datum, list)
+                else _embed(fkey_datum)
+                for fkey_datum in fkey_data
+            ])
 
-    return document
+    return documents
 
 
 @translate_index(AliasType.write)
@@ -278,32 +767,215 @@ def delete_document(index, doc_type, id):
         return error_response(404, 'document not found')
 
 
+def _search_body(body):
+    # type: (Optional[dict]) -> Tuple[dict, bool]
+    """
+    Get the ES search body for the body of a search request (a bare query or a search body with
+    the options in `_SEARCH_BODY_KEYS`), along with whether it has been a search body.
+    """
+    if not (isinstance(body, dict) and _SEARCH_BODY_KEYS.intersection(body)):
+        return {'query': body or {'match_all': {}}}, False
+
+    unsupported = set(body) - _SEARCH_BODY_KEYS
+    if unsupported:
+        raise QueryError('Unsupported search options: {}'.format(', '.join(sorted(unsupported))))
+
+    max_size = current_app.config['LIST_MAX_LIMIT']
+    size = body.get('size', 0)
+    if not isinstance(size, int) or not 0 <= size <= max_size:
+        raise QueryError('size must be between 0 and {}'.format(max_size))
+
+    return body, True
+
+
+def _search_request(source):
+    # type: (Optional[list]) -> Tuple[dict, bool]
+    """`_search_body` for the current request, reading the `source` fields (all for `None`)."""
+    try:
+        # TODO query from GET params?!
+        body = request.get_json()
+    except BadRequest:
+        raise QueryError('Failed to parse request body as JSON')
+
+    body, extended = _search_body(body)
+    if source is not None:
+        body['_source'] = source
+
+    return body, extended
+
+
+def _search_response(result):
+    # type: (SearchResult) -> dict
+    response = {
+        'hits': result.documents,
+        'total': result.total,
+    }
+    if result.aggregations is not None:
+        response['aggregations'] = result.aggregations
+
+    return response
+
+
 @translate_index(AliasType.read)
 def search_documents(index, doc_type):
     # type: (str, str) -> flask.Response
+    """
+    Search with either a bare query (responding with a list of hits) or a search body using the
+    options in `_SEARCH_BODY_KEYS` (responding with the hits, their total and any aggregations).
+    """
+    source, selected = _requested_fields()
 
     try:
-        # TODO query from GET params?!
-        query = request.get_json() or {
-            'query': {
-                'match_all': {}
-            }
-        }
+        body, extended = _search_request(source)
+    except QueryError as error:
+        return error_response(400, error.message)
+
+    try:
+        result = current_app.datastore.search(index, doc_type, body)
+    except TransportError:
+        return error_response(400, 'Invalid query')
+
+    try:
+        _embed_requested_documents(index, doc_type, result.documents)
+    except EmbeddingError as error:
+        return error_response(httplib.BAD_REQUEST, error.message)
+
+    documents = _select_fields(selected, result.documents)
+
+    try:
+        # Only charge valid requests
+        Customer.charge_cycles(g.customer['_id'], index, result.took)
+    except auth.NotFoundError as error:
+        return error_response(httplib.UNAUTHORIZED, error.error)
+
+    if not extended:
+        return jsonify(documents)
+
+    return jsonify(_search_response(result._replace(documents=documents)))
+
+
+def _multi_searches():
+    # type: () -> List[Tuple[str, str, dict]]
+    """
+    The (alias, doc_type, body) of every search in the body of a multi-search request. Raises a
+    `QueryError` for invalid searches and a `ForbiddenError` for indexes without permission.
+    """
+    try:
+        entries = request.get_json()
+    except BadRequest:
+        raise QueryError('Failed to parse request body as JSON')
+
+    max_searches = current_app.config['MSEARCH_MAX_SEARCHES']
+    if not isinstance(entries, list) or not 0 < len(entries) <= max_searches:
+        raise QueryError('Expected a list of 1 to {} searches'.format(max_searches))
+
+    searches = []
+    for position, entry in enumerate(entries):
+        if not (
+            isinstance(entry, dict) and
+            is_single_name(entry.get('index')) and
+            is_single_name(entry.get('doc_type'))
+        ):
+            raise QueryError('Search {} lacks a single index or doc_type'.format(position))
+
+        try:
+            body, _ = _search_body(entry.get('query'))
+        except QueryError as error:
+            raise QueryError('Search {}: {}'.format(position, error.message))
+
+        alias = permitted_alias(entry['index'], AliasType.read)
+        searches.append((alias, entry['doc_type'], body))
+
+    return searches
+
+
+def _multi_search_response(searches, results):
+    # type: (List[Tuple[str, str, dict]], list) -> Tuple[list, Counter]
+    """The response for the results of a multi-search, along with the effort per alias."""
+    response = []
+    charges = Counter()
+    for (alias, _, _), result in zip(searches, results):
+        if isinstance(result, SearchResult):
+            charges[alias] += result.took
+            response.append(_search_response(result))
+        elif result.get('type') == 'index_not_found_exception':
+            response.append({'error': 'index not found'})
+        else:
+            response.append({'error': 'Invalid query'})
+
+    return response, charges
+
+
+def multi_search_documents():
+    # type: () -> flask.Response
+    """
+    Run a list of searches (each with an `index`, `doc_type` and `query` as accepted by
+    `search_documents`) with a single multi-search and charge for them at once. The results are
+    returned in order of the searches, failed searches are reported with an `error`.
+    """
+    try:
+        searches = _multi_searches()
+    except QueryError as error:
+        return error_response(400, error.message)
+
+    try:
+        results = current_app.datastore.multi_search(searches)
+    except TransportError:
+        return error_response(400, 'Invalid query')
+
+    response, charges = _multi_search_response(searches, results)
+
+    if charges:
+        try:
+            # Only charge successful searches
+            Customer.charge_cycles_by_target(g.customer['_id'], dict(charges))
+        except auth.NotFoundError as error:
+            return error_response(httplib.UNAUTHORIZED, error.error)
+
+    return jsonify(response)
+
+
+@translate_index(AliasType.read)
+def count_documents(index, doc_type):
+    # type: (str, str) -> flask.Response
+    """
+    Count the documents matching a query (all documents without one) and aggregate them. The body
+    is either a bare query or an object with `query` and/or `aggs`/`aggregations`.
+    """
+    try:
+        body = request.get_json()
     except BadRequest:
         return error_response(400, 'Failed to parse request body as JSON')
 
+    if isinstance(body, dict) and _COUNT_BODY_KEYS.intersection(body):
+        unsupported = set(body) - _COUNT_BODY_KEYS
+        if unsupported:
+            return error_response(400, 'Unsupported count options: {}'.format(
+                ', '.join(sorted(unsupported))
+            ))
+
+        query = body.get('query')
+        aggregations = body.get('aggs', body.get('aggregations'))
+    else:
+        query = body
+        aggregations = None
+
     try:
-        hits, effort = current_app.datastore.search_documents(index, doc_type, query)
+        result = current_app.datastore.count_documents(index, doc_type, query, aggregations)
     except TransportError:
         return error_response(400, 'Invalid query')
 
     try:
         # Only charge valid requests
-        Customer.charge_cycles(g.customer['_id'], index, effort)
+        Customer.charge_cycles(g.customer['_id'], index, result.took)
     except auth.NotFoundError as error:
         return error_response(httplib.UNAUTHORIZED, error.error)
-    else:
-        return jsonify(hits)
+
+    response = {'total': result.total}
+    if result.aggregations is not None:
+        response['aggregations'] = result.aggregations
+
+    return jsonify(response)
 
 
 @translate_index(AliasType.read)
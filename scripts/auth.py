@@ -184,6 +184,35 @@ def deny(customer_name, grants):
     customer.save()
 
 
+@permissions.command()
+@click.argument('customer_names', nargs=-1)
+def reconcile(customer_names):
+    """Create and delete aliases to match customer permissions.
+
+    Reconciles all customers at once unless given some, e.g. after migrations.
+
+    Usage:
+
+        auth reconcile [CUSTOMER_NAME ...]
+    """
+    customers = None
+    if customer_names:
+        try:
+            customers = [Customer.get_by_name(name) for name in customer_names]
+        except NotFoundError as error:
+            click.secho('* %s' % error.error, fg='red')
+            raise click.Abort()
+
+    click.secho('Reconciling aliases...', bold=True)
+
+    for action in Customer.reconcile_aliases(customers):
+        for name, alias in action.items():
+            click.secho(
+                '- %s %s -> %s' % (name, alias['alias'], alias['index']),
+                fg='green' if name == 'add' else 'yellow'
+            )
+
+
 @permissions.command(name='list')
 @click.argument('customer_name')
 def list_permissions(customer_name):
@@ -206,11 +235,13 @@ def list_permissions(customer_name):
     if len(permissions) <= 0:
         click.secho('* No existing permissions', fg='yellow')
     else:
+        existing = es.indices.get_alias('*_%s_*' % customer_name)
+
         for index in permissions:
             for permission in permissions[index]:
-                alias_exists = es.indices.exists_alias(
-                    index,
-                    get_alias(index, customer_name, permission)
+                alias_exists = (
+                    get_alias(index, customer_name, permission) in
+                    existing.get(index, {}).get('aliases', {})
                 )
                 click.secho(
                     '- %s=%s (%s)' % (index, permission, alias_exists),
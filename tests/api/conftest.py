@@ -136,6 +136,30 @@ def book(author, app):
 
 another_book = book
 
+
+@pytest.yield_fixture
+def book_without_author(app):
+    book = app.datastore.create_document(
+        index='library',
+        doc_type='book',
+        document={
+            'title': uuid4().hex,
+        },
+        refresh=True,
+    )
+
+    yield book
+
+    try:
+        app.datastore.delete_document(
+            index='library',
+            doc_type='book',
+            id=book['_id'],
+        )
+    except NotFoundError:
+        # We don't mind as long as it's gone
+        pass
+
 @pytest.yield_fixture
 def book_series(book, another_book, app):
     series = app.datastore.create_document(
@@ -92,3 +92,188 @@ class TestTheGetEndpoint(object):
         assert author_['name'] == author['name']
         assert author_['awards'][0]['title'] == book_award['title']
         assert author_['awards'][1]['title'] == another_book_award['title']
+
+    def test_leaves_references_to_missing_documents(self, requests, book, author, app):
+        app.datastore.delete_document(index='library', doc_type='author', id=author['_id'])
+
+        response = requests.get(
+            url_for(
+                'document_retrieve',
+                index='library',
+                doc_type='book',
+                id=book['_id'],
+            ),
+            params={'embed': 'author'},
+        )
+
+        assert response.status_code == httplib.OK
+
+        assert response.json()['author'] == author['_id']
+
+    def test_skips_nested_paths_through_missing_documents(self, requests, book, author, app):
+        app.datastore.delete_document(index='library', doc_type='author', id=author['_id'])
+
+        response = requests.get(
+            url_for(
+                'document_retrieve',
+                index='library',
+                doc_type='book',
+                id=book['_id'],
+            ),
+            params={'embed': ['author', 'author.awards']},
+        )
+
+        assert response.status_code == httplib.OK
+
+        assert response.json()['author'] == author['_id']
+
+    def test_rejects_paths_without_fkey(self, requests, book):
+        response = requests.get(
+            url_for(
+                'document_retrieve',
+                index='library',
+                doc_type='book',
+                id=book['_id'],
+            ),
+            params={'embed': 'title'},
+        )
+
+        assert response.status_code == httplib.BAD_REQUEST
+
+
+@pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
+class TestFieldSelection(object):
+
+    def test_can_select_fields(self, requests, book):
+        response = requests.get(
+            url_for(
+                'document_retrieve',
+                index='library',
+                doc_type='book',
+                id=book['_id']
+            ),
+            params={'fields': 'title'},
+        )
+
+        assert response.status_code == httplib.OK
+        assert response.json() == {
+            '_id': book['_id'],
+            '_version': book['_version'],
+            'title': book['title'],
+        }
+
+    def test_can_select_fields_of_embedded_documents(self, requests, book, another_book, author):
+        response = requests.get(
+            url_for(
+                'document_list',
+                index='library',
+                doc_type='book',
+            ),
+            params={'fields': 'title,author.name', 'embed': 'author'},
+        )
+
+        assert response.status_code == httplib.OK
+
+        books = response.json()
+        assert len(books) == 2
+        embedded_author = {
+            '_id': author['_id'],
+            '_version': author['_version'],
+            'name': author['name'],
+        }
+        assert all(listed['author'] == embedded_author for listed in books)
+        assert all(set(listed) == {'_id', 'title', 'author'} for listed in books)
+
+    def test_selects_embedded_documents_as_a_whole(self, requests, book, author):
+        response = requests.post(
+            url_for(
+                'document_search',
+                index='library',
+                doc_type='book',
+            ),
+            params={'fields': 'title', 'embed': 'author'},
+            json={
+                'match': {'title': book['title']}
+            }
+        )
+
+        assert response.status_code == httplib.OK
+        assert response.json() == [{'_id': book['_id'], 'title': book['title'], 'author': author}]
+
+
+@pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
+class TestTheListAndSearchEndpoints(object):
+
+    def test_can_embed_into_listed_documents(self, requests, book, another_book, author):
+        response = requests.get(
+            url_for(
+                'document_list',
+                index='library',
+                doc_type='book',
+            ),
+            params={'embed': 'author'},
+        )
+
+        assert response.status_code == httplib.OK
+
+        books = response.json()
+        assert len(books) == 2
+        assert all(listed['author'] == author for listed in books)
+
+    def test_can_embed_into_search_hits(self, requests, book, author):
+        response = requests.post(
+            url_for(
+                'document_search',
+                index='library',
+                doc_type='book',
+            ),
+            params={'embed': 'author'},
+            json={
+                'match': {'title': book['title']}
+            }
+        )
+
+        assert response.status_code == httplib.OK
+
+        hits = response.json()
+        assert len(hits) == 1
+        assert hits[0]['author'] == author
+
+    def test_embeds_into_listed_documents_with_the_reference_only(
+        self, requests, book, book_without_author, author
+    ):
+        response = requests.get(
+            url_for(
+                'document_list',
+                index='library',
+                doc_type='book',
+            ),
+            params={'embed': 'author'},
+        )
+
+        assert response.status_code == httplib.OK
+
+        books = {listed['_id']: listed for listed in response.json()}
+        assert books[book['_id']]['author'] == author
+        assert 'author' not in books[book_without_author['_id']]
+
+    def test_embeds_into_search_hits_with_the_reference_only(
+        self, requests, book, book_without_author, author
+    ):
+        response = requests.post(
+            url_for(
+                'document_search',
+                index='library',
+                doc_type='book',
+            ),
+            params={'embed': 'author'},
+            json={
+                'match_all': {}
+            }
+        )
+
+        assert response.status_code == httplib.OK
+
+        hits = {hit['_id']: hit for hit in response.json()}
+        assert hits[book['_id']]['author'] == author
+        assert 'author' not in hits[book_without_author['_id']]
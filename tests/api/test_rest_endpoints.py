@@ -4,6 +4,7 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 
 import httplib
+import json
 from uuid import uuid4
 
 from flask import url_for
@@ -57,6 +58,112 @@ class TestTheCreateEndpoint(object):
         assert 'cycles' not in customer
 
 
+@pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
+class TestTheBulkEndpoint(object):
+
+    def test_reports_every_line(self, requests, customer, app):
+        assert 'cycles' not in customer
+
+        index = 'library'
+        alias = get_alias(index, customer.name, AliasType.write.name)
+
+        lines = [
+            json.dumps({'title': uuid4().hex}),
+            json.dumps({'subtitle': 'A book needs a title!'}),
+            '{not json',
+            json.dumps({'title': uuid4().hex}),
+        ]
+
+        response = requests.post(
+            url_for(
+                'document_bulk',
+                index=index,
+                doc_type='book',
+            ),
+            data='\n'.join(lines),
+            headers={'Content-Type': 'application/x-ndjson'},
+        )
+
+        assert response.status_code == httplib.OK
+
+        report = response.json()
+        assert report['errors']
+        assert [item['status'] for item in report['items']] == [
+            httplib.CREATED,
+            httplib.BAD_REQUEST,
+            httplib.BAD_REQUEST,
+            httplib.CREATED,
+        ]
+
+        customer.refresh()
+        assert customer.cycles[alias] == 2 * app.config['CYCLES_CRUD']
+
+    def test_does_not_charge_if_nothing_was_created(self, requests, customer):
+        assert 'cycles' not in customer
+
+        response = requests.post(
+            url_for(
+                'document_bulk',
+                index='library',
+                doc_type='book',
+            ),
+            data=json.dumps({'subtitle': 'A book needs a title!'}),
+            headers={'Content-Type': 'application/x-ndjson'},
+        )
+
+        assert response.status_code == httplib.OK
+        assert response.json()['items'][0]['status'] == httplib.BAD_REQUEST
+
+        customer.refresh()
+        assert 'cycles' not in customer
+
+
+@pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
+class TestTheExportEndpoint(object):
+
+    @pytest.mark.parametrize('encoding', ['identity', 'gzip'])
+    def test_streams_all_documents(self, requests, customer, book, another_book, encoding):
+        alias = get_alias('library', customer.name, AliasType.read.name)
+
+        response = requests.get(
+            url_for(
+                'document_export',
+                index='library',
+                doc_type='book',
+            ),
+            headers={'Accept-Encoding': encoding},
+        )
+
+        assert response.status_code == httplib.OK
+        assert response.headers['Content-Type'] == 'application/x-ndjson'
+        assert response.headers.get('Content-Encoding', 'identity') == encoding
+
+        exported = [json.loads(line) for line in response.text.splitlines()]
+        assert (
+            sorted((document['_id'], document['title']) for document in exported) ==
+            sorted((document['_id'], document['title']) for document in [book, another_book])
+        )
+
+        customer.refresh()
+        assert customer.cycles[alias] > 0
+
+    def test_does_not_charge_on_failure(self, requests, customer, app):
+        app.es.indices.delete('library')
+
+        response = requests.get(
+            url_for(
+                'document_export',
+                index='library',
+                doc_type='book',
+            ),
+        )
+
+        assert response.status_code == httplib.INTERNAL_SERVER_ERROR
+
+        customer.refresh()
+        assert 'cycles' not in customer
+
+
 @pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
 class TestTheRetrieveEndpoint(object):
 
@@ -100,6 +207,72 @@ class TestTheRetrieveEndpoint(object):
         assert 'cycles' not in customer
 
 
+@pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
+class TestTheMultiGetEndpoint(object):
+
+    def test_retrieves_documents_in_order(self, requests, customer, app, book, another_book):
+        alias = get_alias('library', customer.name, AliasType.read.name)
+
+        response = requests.post(
+            url_for(
+                'document_mget',
+                index='library',
+                doc_type='book',
+            ),
+            json={'ids': [another_book['_id'], 'nosuch', book['_id']]}
+        )
+
+        assert response.status_code == httplib.OK
+        assert response.json() == [
+            another_book,
+            {'_id': 'nosuch', '_found': False},
+            book,
+        ]
+
+        customer.refresh()
+        assert customer.cycles[alias] == 2 * app.config['CYCLES_CRUD']
+
+    def test_supports_fields_and_embedding(self, requests, book, author):
+        response = requests.post(
+            url_for(
+                'document_mget',
+                index='library',
+                doc_type='book',
+            ),
+            params={'fields': 'title', 'embed': 'author'},
+            json={'ids': [book['_id']]}
+        )
+
+        assert response.status_code == httplib.OK
+        assert response.json() == [{
+            '_id': book['_id'],
+            '_version': book['_version'],
+            'title': book['title'],
+            'author': author,
+        }]
+
+    @pytest.mark.parametrize('body', [
+        {},
+        {'ids': []},
+        {'ids': 'not a list'},
+        {'ids': [1, 2]},
+    ])
+    def test_rejects_invalid_ids(self, requests, customer, body):
+        response = requests.post(
+            url_for(
+                'document_mget',
+                index='library',
+                doc_type='book',
+            ),
+            json=body
+        )
+
+        assert response.status_code == httplib.BAD_REQUEST
+
+        customer.refresh()
+        assert 'cycles' not in customer
+
+
 @pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
 class TestTheUpdateEndpoint(object):
 
@@ -241,3 +414,38 @@ class TestTheListEndpoint(object):
 
         customer.refresh()
         assert 'cycles' not in customer
+
+    def test_pages_with_cursors(self, requests, book, another_book):
+        url = url_for('document_list', index='library', doc_type='book', limit=1)
+
+        first = requests.get(url)
+        second = requests.get(first.links['next']['url'])
+
+        assert first.status_code == second.status_code == httplib.OK
+        assert len(first.json()) == len(second.json()) == 1
+        assert (
+            sorted([first.json()[0]['_id'], second.json()[0]['_id']]) ==
+            sorted([book['_id'], another_book['_id']])
+        )
+
+        last = requests.get(second.links['next']['url'])
+
+        assert last.status_code == httplib.OK
+        assert last.json() == []
+        assert 'next' not in last.links
+
+    @pytest.mark.parametrize('args', [
+        {'limit': 0},
+        {'limit': 'many'},
+        {'limit': 100000},
+        {'cursor': 'not a cursor'},
+    ])
+    def test_rejects_invalid_pagination(self, requests, customer, args):
+        response = requests.get(
+            url_for('document_list', index='library', doc_type='book', **args),
+        )
+
+        assert response.status_code == httplib.BAD_REQUEST
+
+        customer.refresh()
+        assert 'cycles' not in customer
@@ -48,3 +48,150 @@ class TestTheSearchEndpoint(object):
 
         customer.refresh()
         assert 'cycles' not in customer
+
+    def test_passes_search_options_on(self, requests, book, another_book):
+        response = requests.post(
+            url_for('document_search', index='library', doc_type='book', _external=True),
+            json={
+                'query': {'match_all': {}},
+                'size': 1,
+                'sort': [{'_uid': 'asc'}],
+                '_source': ['title'],
+                'aggs': {'doc_types': {'terms': {'field': '_type'}}},
+            }
+        )
+
+        assert response.status_code == httplib.OK
+
+        result = response.json()
+        assert result['total'] == 2
+        assert len(result['hits']) == 1
+        assert set(result['hits'][0]) == {'_id', 'title'}
+        assert result['hits'][0]['_id'] == min(book['_id'], another_book['_id'])
+        assert result['aggregations']['doc_types']['buckets'] == [{'key': 'book', 'doc_count': 2}]
+
+    @pytest.mark.parametrize('body', [
+        {'query': {'match_all': {}}, 'script_fields': {}},
+        {'query': {'match_all': {}}, 'size': 100000},
+    ])
+    def test_rejects_unsupported_search_options(self, requests, customer, body):
+        response = requests.post(
+            url_for('document_search', index='library', doc_type='book', _external=True),
+            json=body
+        )
+
+        assert response.status_code == httplib.BAD_REQUEST
+
+        customer.refresh()
+        assert 'cycles' not in customer
+
+
+@pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
+class TestTheCountEndpoint(object):
+
+    def test_counts_all_documents(self, requests, customer, book, another_book):
+        response = requests.get(
+            url_for('document_count', index='library', doc_type='book', _external=True),
+        )
+
+        assert response.status_code == httplib.OK
+        assert response.json() == {'total': 2}
+
+        customer.refresh()
+        assert customer.cycles['library_{}_search'.format(customer.name)] > 0
+
+    def test_counts_and_aggregates_matching_documents(self, requests, book, another_book):
+        response = requests.post(
+            url_for('document_count', index='library', doc_type='book', _external=True),
+            json={
+                'query': {'match': {'title': book['title']}},
+                'aggs': {'doc_types': {'terms': {'field': '_type'}}},
+            }
+        )
+
+        assert response.status_code == httplib.OK
+        assert response.json() == {
+            'total': 1,
+            'aggregations': {
+                'doc_types': {
+                    'doc_count_error_upper_bound': 0,
+                    'sum_other_doc_count': 0,
+                    'buckets': [{'key': 'book', 'doc_count': 1}],
+                }
+            }
+        }
+
+    def test_does_not_charge_for_failed_requests(self, requests, customer):
+        response = requests.post(
+            url_for('document_count', index='library', doc_type='book', _external=True),
+            json={'query': {'match_all': {}}, 'size': 10}
+        )
+
+        assert response.status_code == httplib.BAD_REQUEST
+
+        customer.refresh()
+        assert 'cycles' not in customer
+
+
+@pytest.mark.usefixtures('live_server', 'customer_with_library_permissions')
+class TestTheMultiSearchEndpoint(object):
+
+    def test_returns_results_by_position(self, requests, customer, book, author):
+        response = requests.post(
+            url_for('msearch', _external=True),
+            json=[
+                {
+                    'index': 'library',
+                    'doc_type': 'book',
+                    'query': {'match': {'title': book['title']}},
+                },
+                {'index': 'library', 'doc_type': 'author', 'query': {'size': 0}},
+                {
+                    'index': 'library',
+                    'doc_type': 'book',
+                    'query': {'syntactically correct': {'otherwise crap': {}}},
+                },
+            ]
+        )
+
+        assert response.status_code == httplib.OK
+
+        books, authors, failed = response.json()
+        assert books['total'] == 1
+        assert books['hits'][0]['_id'] == book['_id']
+        assert authors == {'hits': [], 'total': 1}
+        assert 'error' in failed
+
+        customer.refresh()
+        assert customer.cycles['library_{}_search'.format(customer.name)] > 0
+
+    @pytest.mark.parametrize('body', [
+        {'index': 'library', 'doc_type': 'book'},
+        [],
+        [{'index': 'library'}],
+        [{'index': 'library', 'doc_type': 'book', 'query': {'script_fields': {}, 'size': 1}}],
+        [{'index': 'library,media', 'doc_type': 'book'}],
+        [{'index': '_all', 'doc_type': 'book'}],
+        [{'index': 'library', 'doc_type': 'book,*'}],
+    ])
+    def test_rejects_invalid_searches(self, requests, customer, body):
+        response = requests.post(url_for('msearch', _external=True), json=body)
+
+        assert response.status_code == httplib.BAD_REQUEST
+
+        customer.refresh()
+        assert 'cycles' not in customer
+
+    def test_rejects_indexes_without_permission(self, requests, customer):
+        response = requests.post(
+            url_for('msearch', _external=True),
+            json=[
+                {'index': 'library', 'doc_type': 'book'},
+                {'index': 'media', 'doc_type': 'picture'},
+            ]
+        )
+
+        assert response.status_code == httplib.FORBIDDEN
+
+        customer.refresh()
+        assert 'cycles' not in customer
@@ -0,0 +1,135 @@
+# coding: utf-8
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from flask import Flask, g
+from mock import Mock
+import pytest
+
+from reles.auth import aliases as aliases_module
+from reles.auth.aliases import (
+    AliasTable,
+    AliasType,
+    permitted_alias,
+    translate_index,
+)
+from reles.auth.exceptions import ForbiddenError
+
+
+@pytest.fixture
+def es():
+    return Mock(**{
+        'indices.get_alias.return_value': {
+            'library': {'aliases': {'library_kattegat_search': {}}},
+            'media': {'aliases': {}},
+        },
+        'indices.exists_alias.return_value': False,
+    })
+
+
+@pytest.fixture
+def table():
+    return AliasTable(max_size=2, refresh_interval=60)
+
+
+class TestAliasTable(object):
+    def test_memoizes_aliases_and_components(self, table):
+        alias = table.get_alias('library', 'kattegat', AliasType.write.name)
+
+        assert alias == 'library_kattegat_index'
+        assert table.get_alias('library', 'kattegat', AliasType.write.name) is alias
+        assert table.unalias(alias) == ('library', 'kattegat', AliasType.write.name)
+        assert table.unalias('media_wessex_search') == ('media', 'wessex', AliasType.read.name)
+
+        with pytest.raises(Exception):
+            table.unalias('library_kattegat_nosuch')
+
+    def test_is_bounded(self, table):
+        for customer in ('kattegat', 'wessex', 'paris'):
+            table.get_alias('library', customer, AliasType.read.name)
+
+        assert len(table._aliases) == 2
+        assert len(table._components) == 2
+        assert ('library', 'kattegat', AliasType.read.name) not in table._aliases
+
+    def test_knows_existing_aliases_once_primed(self, table, es):
+        assert table.exists('library_kattegat_search') is None
+
+        table.prime(es)
+
+        assert table.exists('library_kattegat_search') is True
+        assert table.exists('library_kattegat_index') is False
+
+        table.add('library_kattegat_index')
+        table.remove('library_kattegat_search')
+
+        assert table.exists('library_kattegat_index') is True
+        assert table.exists('library_kattegat_search') is False
+        assert es.indices.get_alias.call_count == 1
+        assert es.indices.exists_alias.call_count == 1
+
+    def test_checks_unknown_aliases_with_elasticsearch(self, table, es):
+        table.prime(es)
+        es.indices.exists_alias.return_value = True
+
+        assert table.exists('library_wessex_search') is True
+        assert table.exists('library_wessex_search') is True
+        assert es.indices.exists_alias.call_count == 1
+
+    def test_knows_missing_aliases_for_the_refresh_interval(self, table, es):
+        table.prime(es)
+
+        assert table.exists('library_wessex_search') is False
+        assert table.exists('library_wessex_search') is False
+        assert es.indices.exists_alias.call_count == 1
+
+        table.refresh_interval = 0
+        es.indices.exists_alias.return_value = True
+
+        assert table.exists('library_wessex_search') is True
+        assert es.indices.exists_alias.call_count == 2
+
+
+def test_translate_index_rejects_missing_aliases(monkeypatch, es):
+    table = AliasTable()
+    table.prime(es)
+    monkeypatch.setattr(aliases_module, 'aliases', table)
+
+    @translate_index(AliasType.read)
+    def view(index):
+        return index
+
+    app = Flask(__name__)
+    with app.test_request_context():
+        g.customer = {'name': 'kattegat'}
+
+        assert view(index='library') == 'library_kattegat_search'
+        with pytest.raises(ForbiddenError) as error:
+            view(index='media')
+        assert error.value.status_code == 403
+
+
+@pytest.mark.parametrize('index', ['library,media', 'library*', '_all', '', None, ['library']])
+def test_permitted_alias_rejects_several_indexes(monkeypatch, es, index):
+    table = AliasTable()
+    table.prime(es)
+    monkeypatch.setattr(aliases_module, 'aliases', table)
+
+    with Flask(__name__).test_request_context():
+        g.customer = {'name': 'kattegat'}
+
+        with pytest.raises(ForbiddenError):
+            permitted_alias(index, AliasType.read)
+
+
+def test_permitted_alias_rejects_missing_aliases(monkeypatch, es):
+    table = AliasTable()
+    table.prime(es)
+    monkeypatch.setattr(aliases_module, 'aliases', table)
+
+    with Flask(__name__).test_request_context():
+        g.customer = {'name': 'kattegat'}
+
+        assert permitted_alias('library', AliasType.read) == 'library_kattegat_search'
+        with pytest.raises(ForbiddenError):
+            permitted_alias('media', AliasType.read)
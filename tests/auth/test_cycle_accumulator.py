@@ -0,0 +1,122 @@
+# coding: utf-8
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import logging
+from threading import Event
+
+from elasticsearch.serializer import JSONSerializer
+from mock import Mock
+import pytest
+
+from reles.auth.cycles import CycleAccumulator
+from reles.auth.exceptions import NotFoundError
+
+
+def _bulk_response(*statuses):
+    return {
+        'errors': any(status != 200 for status in statuses),
+        'items': [
+            {'update': {'status': status, 'error': None if status == 200 else 'failed'}}
+            for status in statuses
+        ],
+    }
+
+
+def _charged(es):
+    """The charges sent with the last bulk request, by customer."""
+    lines = [json.loads(line) for line in es.bulk.call_args[0][0].splitlines()]
+
+    return {
+        action['update']['_id']: body['script']['params']['charges']
+        for action, body in zip(lines[::2], lines[1::2])
+    }
+
+
+class TestCycleAccumulator(object):
+    @pytest.fixture()
+    def es(self):
+        return Mock(**{
+            'exists.return_value': True,
+            'bulk.return_value': _bulk_response(200),
+            'transport.serializer': JSONSerializer(),
+        })
+
+    @pytest.fixture()
+    def accumulator(self, es):
+        return CycleAccumulator(es, 'auth', 'customer', logging.getLogger(__name__))
+
+    def test_coalesces_charges_per_customer_and_target(self, accumulator, es):
+        accumulator.charge('kattegat', {'library_kattegat_search': 1})
+        accumulator.charge('kattegat', {'library_kattegat_search': 2, 'library_kattegat_index': 3})
+
+        assert es.bulk.call_count == 0
+
+        accumulator.flush()
+
+        assert es.bulk.call_count == 1
+        assert _charged(es) == {
+            'kattegat': {'library_kattegat_search': 3, 'library_kattegat_index': 3},
+        }
+
+    def test_flushes_on_threshold(self, es):
+        flushed = Event()
+        es.bulk.side_effect = lambda *args, **kwargs: flushed.set() or _bulk_response(200)
+        accumulator = CycleAccumulator(
+            es, 'auth', 'customer', logging.getLogger(__name__),
+            flush_interval=60, flush_threshold=2
+        )
+        accumulator.start()
+
+        try:
+            accumulator.charge('kattegat', {'library_kattegat_search': 1})
+            assert not flushed.wait(0.1)
+
+            accumulator.charge('kattegat', {'library_kattegat_search': 1})
+            assert flushed.wait(5)
+        finally:
+            accumulator.stop()
+
+        assert es.bulk.call_count == 1
+
+    def test_caches_known_customers(self, accumulator, es):
+        accumulator.charge('kattegat', {'library_kattegat_search': 1})
+        accumulator.charge('kattegat', {'library_kattegat_search': 1})
+
+        assert es.exists.call_count == 1
+
+    def test_rejects_unknown_customers(self, accumulator, es):
+        es.exists.return_value = False
+
+        with pytest.raises(NotFoundError):
+            accumulator.charge('nosuch', {'library_nosuch_search': 1})
+
+        accumulator.flush()
+        assert es.bulk.call_count == 0
+
+    def test_keeps_charges_that_failed(self, accumulator, es):
+        es.bulk.return_value = _bulk_response(500)
+        accumulator.charge('kattegat', {'library_kattegat_search': 1})
+        accumulator.flush()
+
+        es.bulk.return_value = _bulk_response(200)
+        accumulator.flush()
+
+        assert es.bulk.call_count == 2
+        assert _charged(es) == {'kattegat': {'library_kattegat_search': 1}}
+
+    def test_drops_charges_of_deleted_customers(self, accumulator, es):
+        es.bulk.return_value = _bulk_response(404)
+        accumulator.charge('kattegat', {'library_kattegat_search': 1})
+        accumulator.flush()
+        accumulator.flush()
+
+        assert es.bulk.call_count == 1
+
+    def test_flushes_when_stopped(self, accumulator, es):
+        accumulator.start()
+        accumulator.charge('kattegat', {'library_kattegat_search': 1})
+        accumulator.stop()
+
+        assert es.bulk.call_count == 1
@@ -9,6 +9,7 @@ from mock import Mock
 import pytest
 
 from reles.auth import middleware, utils
+from reles.persistence import SwaggerSchemaStore
 
 
 _TEST_AUTH_JWT_ALGORITHM = 'HS512'
@@ -180,3 +181,120 @@ def test_secure_expired_jwt_is_401(test_client, expired_jwt, login_required):
     res = test_client.get('/secure', headers=headers)
     assert res.status_code == 401
     assert 'expired' in loads(res.data)['message']
+
+
+@pytest.fixture()
+def claims_cache(app):
+    app.jwt_claims = middleware.ClaimsCache(max_size=2)
+
+    return app.jwt_claims
+
+
+def test_secure_valid_jwt_is_decoded_once(
+    test_client, valid_jwt, login_required, claims_cache, monkeypatch
+):
+    decode = Mock(wraps=jwt.decode)
+    monkeypatch.setattr(middleware.jwt, 'decode', decode)
+
+    headers = {
+        'Authorization': 'Bearer {}'.format(valid_jwt)
+    }
+
+    for _ in range(3):
+        res = test_client.get('/secure', headers=headers)
+        assert res.status_code == 200
+
+    assert decode.call_count == 1
+    assert claims_cache.counters['hits'] == 2
+
+
+def test_secure_cached_jwt_is_401_after_rotating_the_secret(
+    test_client, app, valid_jwt, login_required, claims_cache
+):
+    headers = {
+        'Authorization': 'Bearer {}'.format(valid_jwt)
+    }
+
+    assert test_client.get('/secure', headers=headers).status_code == 200
+
+    app.config['AUTH_JWT_SECRET'] = b'ROTATED'
+
+    assert test_client.get('/secure', headers=headers).status_code == 401
+
+
+def test_claims_cache_honours_expiry_and_size():
+    cache = middleware.ClaimsCache(max_size=2)
+    now = time.time()
+
+    cache.put('expired', 'key', 'HS512', {'exp': now - 1})
+    cache.put('premature', 'key', 'HS512', {'exp': now + 60, 'nbf': now + 30})
+    assert cache.get('expired', 'key', 'HS512') is None
+    assert cache.get('premature', 'key', 'HS512') is None
+
+    for token in ('a', 'b', 'c'):
+        cache.put(token, 'key', 'HS512', {'exp': now + 60})
+
+    assert cache.get('a', 'key', 'HS512') is None
+    assert cache.get('c', 'key', 'HS512') == {'exp': now + 60}
+    assert cache.get('c', 'other', 'HS512') is None
+
+    cache.clear()
+    assert cache.get('c', 'key', 'HS512') is None
+
+
+def test_claims_cache_honours_its_ttl():
+    cache = middleware.ClaimsCache(ttl=0)
+
+    cache.put('token', 'key', 'HS512', {'exp': time.time() + 60})
+    assert cache.get('token', 'key', 'HS512') is None
+
+
+@pytest.fixture()
+def security():
+    schemastore = SwaggerSchemaStore()
+    schemastore.add_schema('library', {
+        'security': [{'jwt': []}],
+        'definitions': {'book': {'type': 'object'}},
+    })
+    schemastore.add_schema('cdn', {
+        'security': [{'jwt': []}],
+        'paths': {
+            '/cdn/files/{filename}': {
+                'get': {'security': []},
+                'delete': {},
+            },
+        },
+    })
+    schemastore.add_schema('login', {
+        'security': [],
+        'paths': {'/login': {'get': {}}},
+    })
+
+    table = middleware.SecurityTable(schemastore)
+    table.compile()
+
+    return table
+
+
+def test_security_table_resolves_operations(security):
+    assert security.requires_jwt('GET', '/login') is False
+    assert security.requires_jwt('GET', '/library/book/') is True
+    assert security.requires_jwt('PUT', '/library/book/ivanhoe') is True
+    assert security.requires_jwt('GET', '/cdn/files/cover.png') is False
+    assert security.requires_jwt('HEAD', '/cdn/files/cover.png') is False
+    assert security.requires_jwt('DELETE', '/cdn/files/cover.png') is True
+
+
+def test_security_table_falls_back_to_endpoints(security):
+    assert security.requires_jwt('OPTIONS', '/login') is False
+    assert security.requires_jwt('GET', '/cdn/files/') is True
+    assert security.requires_jwt('GET', '/nosuch') is None
+
+
+def test_security_table_recompiles_replaced_specs(security):
+    security._schemastore.add_schema('library', {
+        'security': [],
+        'definitions': {'book': {'type': 'object'}},
+    })
+
+    assert security.requires_jwt('PUT', '/library/book/ivanhoe') is False
@@ -3,12 +3,13 @@ from __future__ import absolute_import, unicode_literals
 from uuid import uuid4
 
 from elasticsearch_dsl import Index
+from mock import patch
 import pytest
 
 from reles.auth import models as auth_models
 from reles.auth.aliases import AliasType, get_alias
 from reles.auth.exceptions import ConflictError, NotFoundError
-from reles.auth.models import Customer, User
+from reles.auth.models import Customer, LookupCache, User
 
 
 @pytest.yield_fixture
@@ -104,6 +105,21 @@ class TestTheCustomerModel(object):
         with pytest.raises(NotFoundError):
             Customer.get_by_name(uuid4().hex)
 
+    def test_caches_lookups_until_saved(self, customer_index, customer):
+        Customer.get_by_name(customer.name)
+
+        with patch.object(Customer, 'search') as search:
+            match = Customer.get_by_name(customer.name)
+
+            assert search.call_count == 0
+            assert match.to_dict() == customer.to_dict()
+            assert match is not Customer.get_by_name(customer.name)
+
+        customer.add_permissions({customer_index._name: [AliasType.read.name]})
+        customer.save(index=customer_index._name, refresh=True)
+
+        assert Customer.get_by_name(customer.name).to_dict() == customer.to_dict()
+
     def test_handles_conflicting_customer_names(self, customer_index, customer):
         Customer(name=customer.name).save(index=customer_index._name, refresh=True)
 
@@ -350,6 +366,19 @@ class TestTheCustomerModel(object):
         assert len(aliases[random_index._name]['aliases']) == 1
         assert random_read_alias in aliases[random_index._name]['aliases']
 
+    def test_reconciles_aliases_of_several_customers(self, app, customer, random_index):
+        other = Customer(name=uuid4().hex, permissions={random_index._name: [AliasType.read.name]})
+        customer.permissions = {random_index._name: [AliasType.write.name]}
+
+        actions = Customer.reconcile_aliases([customer, other])
+
+        assert len(actions) == 2
+        aliases = app.es.indices.get_alias()[random_index._name]['aliases']
+        assert get_alias(random_index._name, customer.name, AliasType.write.name) in aliases
+        assert get_alias(random_index._name, other.name, AliasType.read.name) in aliases
+
+        assert Customer.reconcile_aliases([customer, other]) == []
+
     def test_can_init_cycles(self, customer):
         assert 'cycles' not in customer
 
@@ -416,3 +445,67 @@ class TestTheUserModel(object):
 
         with pytest.raises(ConflictError):
             User.get_by_email(user.email)
+
+    def test_can_look_past_the_cache(self, user_index, user):
+        User.get_by_email(user.email)
+
+        # as if deleted by another process
+        with patch.object(auth_models.users_by_email, 'clear'):
+            user.delete(index=user_index._name, refresh=True)
+
+        assert User.get_by_email(user.email) == user
+
+        with pytest.raises(NotFoundError):
+            User.get_by_email(user.email, cached=False)
+
+
+class TestTheLookupCache(object):
+
+    def test_expires_entries(self):
+        cache = LookupCache(ttl=-1)
+        cache.put('kattegat', Customer(name='kattegat'))
+
+        assert cache.get('kattegat') is None
+
+    def test_can_be_disabled(self):
+        cache = LookupCache(ttl=0)
+        cache.put('kattegat', Customer(name='kattegat'))
+
+        assert cache.get('kattegat') is None
+        assert cache.counters['misses'] == 1
+
+    def test_hands_out_copies(self):
+        cache = LookupCache()
+        cache.put('kattegat', Customer(name='kattegat'))
+
+        cache.get('kattegat').name = 'skagerrak'
+
+        assert cache.get('kattegat').name == 'kattegat'
+        assert cache.counters['hits'] == 2
+
+
+class TestTheAliasActions(object):
+
+    def test_diffs_permissions_against_existing_aliases(self):
+        existing = {
+            'library': {'aliases': {
+                'library_kattegat_search': {},
+                'library_kattegat_index': {},
+                'library_wessex_index': {},
+                'shelf': {},
+            }},
+            'media': {'aliases': {}},
+        }
+        permissions = {
+            'kattegat': {'library': ['read'], 'media': ['read']},
+        }
+
+        assert auth_models._alias_actions(permissions, existing) == [
+            {'remove': {'index': 'library', 'alias': 'library_kattegat_index'}},
+            {'add': {'index': 'media', 'alias': 'media_kattegat_search'}},
+        ]
+
+    def test_is_empty_when_reconciled(self):
+        existing = {'library': {'aliases': {'library_kattegat_search': {}}}}
+
+        assert auth_models._alias_actions({'kattegat': {'library': ['read']}}, existing) == []
@@ -20,6 +20,7 @@ import pytest
 import requests as _requests
 
 from reles import create_app
+from reles.auth.aliases import aliases
 from reles.auth.models import auth_index as original_auth_index, Customer, User
 from reles.auth import utils
 from reles.database import db as _db
@@ -90,6 +91,9 @@ def app(live_server_host_name):
 
     _app = create_app(schema_path)
     _app.config['SERVER_NAME'] = live_server_host_name
+    # fixtures grant aliases after the (forked) live server learned which exist, so always check
+    # missing ones with Elasticsearch
+    aliases.refresh_interval = 0
 
     original_auth_index.delete()
 
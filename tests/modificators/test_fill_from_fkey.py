@@ -185,7 +185,7 @@ def processor(test_schema, related_document, another_related_document):
     }
 
     datastore = create_autospec(DataStore)
-    datastore.get_document.side_effect = lambda index, doc_type, id: {
+    datastore.get_document.side_effect = lambda index, doc_type, id, **kwargs: {
         'relatedFieldId': related_document,
         'anotherRelatedFieldId': another_related_document,
     }[id]
@@ -49,7 +49,9 @@ def datastore():
     }
 
     datastore = create_autospec(DataStore, spec_set=True, instance=True)
-    datastore.get_document.side_effect = lambda idx, dt, id: docs[id]
+    datastore.get_documents.side_effect = lambda idx, dt, ids, **kwargs: [
+        docs.get(id) for id in ids
+    ]
 
     return datastore
 
@@ -95,3 +97,55 @@ class TestTheIncludeParentsModifier(object):
         processed = processor.process(given)
 
         assert processed == given
+
+    def test_fetches_each_level_at_once(self, test_schema, processor, datastore):
+        given = validate(
+            test_schema,
+            {
+                'name': 'brangelina',
+                'children': [8, 7]
+            }
+        )
+
+        processed = processor.process(given)
+
+        assert sorted(processed['children']) == [0, 2, 3, 4, 6, 7, 8]
+        # levels: {8, 7}, {6, 4}, {3, 2}, {0} (2 has been seen already when coming from 3)
+        assert datastore.get_documents.call_count == 4
+        assert not datastore.get_document.called
+
+    def test_rejects_cycles(self, test_schema, processor, datastore):
+        docs = {
+            0: {'parent': 1},
+            1: {'parent': 2},
+            2: {'parent': 3},
+            3: {'parent': 1},
+        }
+        datastore.get_documents.side_effect = lambda idx, dt, ids, **kwargs: [
+            docs[id] for id in ids
+        ]
+
+        given = validate(
+            test_schema,
+            {
+                'name': 'escher',
+                'children': [0]
+            }
+        )
+
+        with pytest.raises(ValidationError) as error:
+            processor.process(given)
+
+        assert 'cyclic parents testIndex/testDocType/1 -> 2 -> 3 -> 1' in error.value.message
+
+    def test_rejects_missing_parents(self, test_schema, processor):
+        given = validate(
+            test_schema,
+            {
+                'name': 'orphan',
+                'children': [42]
+            }
+        )
+
+        with pytest.raises(ValidationError):
+            processor.process(given)
@@ -33,15 +33,18 @@ def test_schema():
 
 
 @pytest.fixture
-def processor(test_schema):
+def test_processors():
     def reverser(entity, schema, parent, context):
         if isinstance(entity, collections.Iterable):
             return entity[::-1]
 
-    test_processors = {
+    return {
         'x-reverse': reverser
     }
 
+
+@pytest.fixture
+def processor(test_schema, test_processors):
     return Processor(
         test_schema,
         datastore=defaultdict(dict),
@@ -78,3 +81,34 @@ def test_reverser_gets_applied(test_schema, processor):
     processed = processor.process(given)
 
     assert processed['reverse_me'] == 'dlrow olleh'
+
+
+def test_plan_only_contains_paths_with_processors(processor):
+    assert [key for key, _ in processor.plan.properties] == ['reverse_me']
+
+
+def test_nested_processors_get_applied(test_schema, test_processors):
+    test_schema['properties']['key3']['properties']['key3key2']['items']['x-reverse'] = True
+
+    processor = Processor(
+        check_schema(test_schema),
+        datastore=defaultdict(dict),
+        processors=test_processors
+    )
+
+    given = validate(
+        test_schema,
+        {
+            'key1': 'value1',
+            'key3': {
+                'key3key1': 'key3key1value1',
+                'key3key2': ['abc', 'def'],
+            },
+        }
+    )
+
+    processed = processor.process(given)
+
+    assert processed['key1'] == 'value1'
+    assert processed['key3']['key3key1'] == 'key3key1value1'
+    assert processed['key3']['key3key2'] == ['cba', 'fed']
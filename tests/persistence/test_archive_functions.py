@@ -6,6 +6,7 @@ import pytest
 from reles.versioning import (
     VersioningException,
     archive_document_version,
+    archive_document_versions,
     list_document_versions,
     retrieve_document_version,
 )
@@ -89,6 +90,23 @@ class TestReadWrite(object):
 
         assert expected in all_archived
 
+    def test_read_our_batched_writes(self):
+        expected = [{'key1': 'value1'}, {'key1': 'value2'}]
+        archive_document_versions([
+            ('valid_doc_type', 'valid_key', 1111, expected[0]),
+            ('valid_doc_type', 'other_key', 1111, expected[1]),
+        ])
+
+        assert retrieve_document_version('valid_doc_type', 'valid_key', 1111) == expected[0]
+        assert retrieve_document_version('valid_doc_type', 'other_key', 1111) == expected[1]
+
+    def test_batched_duplicate_version_fails(self):
+        with pytest.raises(VersioningException):
+            archive_document_versions([
+                ('valid_doc_type', 'valid_key', 1212, {'does_not': 'matter'}),
+                ('valid_doc_type', 'valid_key', 1212, {'if_it': 'is_different'}),
+            ])
+
 
 @pytest.mark.usefixtures('db_session')
 class TestBugs(object):
@@ -2,9 +2,11 @@ from uuid import uuid4
 
 from elasticsearch.exceptions import NotFoundError
 from elasticsearch_dsl import Index
+from flask import Flask
+from mock import MagicMock, Mock
 import pytest
 
-from reles.persistence import DataStore
+from reles.persistence import DataStore, DocumentCache
 
 
 @pytest.fixture()
@@ -108,3 +110,362 @@ class TestPersistenceDataStore(object):
     def test_does_not_update_without_authorization(self, datastore, random_doctype):
         with pytest.raises(NotFoundError):
             datastore.update_document('nosuch_aliasor_index', random_doctype, 'random_id', {'new': 'document'})
+
+
+class TestPersistenceDataStoreWrites(object):
+    @pytest.fixture()
+    def es(self):
+        return Mock(**{
+            'index.return_value': {'_id': 'new_id', '_version': 1},
+            'update.return_value': {
+                '_id': 'new_id',
+                '_version': 2,
+                'get': {'_source': {'key1': 'value1', 'key2': 'value2'}},
+            },
+            'get.return_value': {'_id': 'new_id', '_version': 2, '_source': {'key1': 'value1'}},
+        })
+
+    def test_create_does_not_read_back(self, es):
+        created = DataStore(es).create_document('index', 'doc_type', {'key1': 'value1'})
+
+        assert created == {'key1': 'value1', '_id': 'new_id', '_version': 1}
+        assert not es.get.called
+
+    def test_update_does_not_read_back(self, es):
+        updated = DataStore(es).update_document('index', 'doc_type', 'new_id', {'key2': 'value2'})
+
+        assert updated == {'key1': 'value1', 'key2': 'value2', '_id': 'new_id', '_version': 2}
+        assert es.update.call_args[1]['_source'] is True
+        assert not es.get.called
+
+    def test_reads_back_if_configured(self, es):
+        datastore = DataStore(es, read_after_write=True)
+
+        datastore.create_document('index', 'doc_type', {'key1': 'value1'})
+        datastore.update_document('index', 'doc_type', 'new_id', {'key2': 'value2'})
+
+        assert es.get.call_count == 2
+
+
+class TestPersistenceDataStoreReads(object):
+    @pytest.fixture()
+    def es(self):
+        return Mock(**{
+            'get.return_value': {'_id': 'an_id', '_version': 1, '_source': {}},
+        })
+
+    def test_get_is_realtime_by_default(self, es):
+        datastore = DataStore(es)
+
+        datastore.get_document('index', 'doc_type', 'an_id')
+
+        assert es.get.call_args[1]['realtime'] is True
+        assert 'refresh' not in es.get.call_args[1]
+        assert datastore.counters['get'] == 1
+        assert datastore.counters['get_refresh'] == 0
+
+    def test_get_refreshes_on_request(self, es):
+        datastore = DataStore(es)
+
+        datastore.get_document('index', 'doc_type', 'an_id', refresh=True)
+
+        assert es.get.call_args[1]['refresh'] is True
+        assert datastore.counters['get_refresh'] == 1
+
+    def test_get_refreshes_if_configured(self, es):
+        datastore = DataStore(es, refresh_reads=True)
+
+        datastore.get_document('index', 'doc_type', 'an_id')
+        datastore.get_document('index', 'doc_type', 'an_id', refresh=False)
+
+        assert datastore.counters['get'] == 2
+        assert datastore.counters['get_refresh'] == 1
+
+    def test_reads_selected_fields_only(self, es):
+        datastore = DataStore(es)
+
+        datastore.get_document('index', 'doc_type', 'an_id', fields=['title', 'author'])
+
+        assert es.get.call_args[1]['_source_include'] == ['title', 'author']
+
+
+class TestPersistenceDataStoreListings(object):
+    @pytest.fixture()
+    def es(self):
+        def _page(hits):
+            return {
+                '_scroll_id': 'scroll',
+                'took': 2,
+                'hits': {'hits': [{'_id': id, '_source': {}} for id in hits]},
+            }
+
+        return Mock(**{
+            'search.return_value': _page(['a', 'b']),
+            'scroll.side_effect': [_page(['c']), _page([])],
+        })
+
+    def test_continues_listings_after_sort_values(self, es):
+        datastore = DataStore(es)
+
+        documents, _ = datastore.list_documents('index', 'doc_type', limit=2)
+        datastore.list_documents(
+            'index',
+            'doc_type',
+            limit=2,
+            offset=10,
+            search_after=datastore.sort_values('doc_type', documents[-1]),
+        )
+
+        first, second = [call[1] for call in es.search.call_args_list]
+        assert first['body']['sort'] == second['body']['sort']
+        assert 'search_after' not in first['body']
+        assert second['body']['search_after'] == ['doc_type#b']
+        assert second['from_'] == 0
+
+    def test_scrolls_through_documents_in_chunks(self, es):
+        datastore = DataStore(es)
+
+        chunks = list(datastore.scroll_documents('index', 'doc_type', chunk_size=2))
+
+        assert [[document['_id'] for document in chunk] for chunk, _ in chunks] == [
+            ['a', 'b'],
+            ['c'],
+        ]
+        assert sum(took for _, took in chunks) == 4
+        es.clear_scroll.assert_called_once_with(scroll_id='scroll', ignore=(404,))
+
+    def test_clears_abandoned_scrolls(self, es):
+        datastore = DataStore(es)
+
+        chunks = datastore.scroll_documents('index', 'doc_type')
+        next(chunks)
+        chunks.close()
+
+        assert es.scroll.call_count == 0
+        es.clear_scroll.assert_called_once_with(scroll_id='scroll', ignore=(404,))
+
+
+class TestPersistenceDataStoreSearches(object):
+    @pytest.fixture()
+    def es(self):
+        return Mock(**{
+            'search.return_value': {
+                'took': 3,
+                'hits': {
+                    'total': 42,
+                    'hits': [
+                        {
+                            '_id': 'a',
+                            '_source': {'title': 'Ivanhoe'},
+                            'highlight': {'title': ['x']},
+                        },
+                        {'_id': 'b'},
+                    ],
+                },
+                'aggregations': {'titles': {'buckets': []}},
+            },
+        })
+
+    def test_returns_totals_and_aggregations(self, es):
+        body = {'query': {'match_all': {}}, 'size': 2, '_source': ['title'], 'aggs': {}}
+
+        result = DataStore(es).search('index', 'doc_type', body)
+
+        assert es.search.call_args[1]['body'] == body
+        assert result.total == 42
+        assert result.aggregations == {'titles': {'buckets': []}}
+        assert result.took == 3
+        assert result.documents == [
+            {'_id': 'a', 'title': 'Ivanhoe', '_highlight': {'title': ['x']}},
+            {'_id': 'b'},
+        ]
+
+    def test_counts_without_fetching_documents(self, es):
+        result = DataStore(es).count_documents('index', 'doc_type', aggregations={'titles': {}})
+
+        assert es.search.call_args[1]['body'] == {
+            'query': {'match_all': {}},
+            'size': 0,
+            'aggs': {'titles': {}},
+        }
+        assert result.total == 42
+
+    def test_runs_multiple_searches_at_once(self, es):
+        es.msearch.return_value = {'responses': [
+            es.search.return_value,
+            {'error': {'type': 'index_not_found_exception'}},
+        ]}
+
+        results = DataStore(es).multi_search([
+            ('index', 'doc_type', {'query': {'match_all': {}}}),
+            ('nosuch', 'doc_type', {'query': {'match_all': {}}}),
+        ])
+
+        assert es.msearch.call_count == 1
+        assert es.msearch.call_args[1]['body'] == [
+            {'index': 'index', 'type': 'doc_type'},
+            {'query': {'match_all': {}}},
+            {'index': 'nosuch', 'type': 'doc_type'},
+            {'query': {'match_all': {}}},
+        ]
+        assert results[0].total == 42
+        assert results[1] == {'type': 'index_not_found_exception'}
+
+    def test_searches_documents_by_query(self, es):
+        documents, took = DataStore(es).search_documents('index', 'doc_type', {'match_all': {}})
+
+        assert es.search.call_args[1]['body'] == {'query': {'match_all': {}}}
+        assert len(documents) == 2
+        assert took == 3
+
+
+class TestPersistenceDataStoreRequestCache(object):
+    @pytest.fixture()
+    def es(self):
+        return Mock(**{
+            'get.return_value': {'_id': 'a', '_version': 1, '_source': {'key1': 'value1'}},
+            'mget.side_effect': lambda index, doc_type, body, **kwargs: {
+                'docs': [
+                    {'_id': id, '_version': 1, '_source': {}, 'found': True}
+                    for id in body['ids']
+                ]
+            },
+            'update.return_value': {'_id': 'a', '_version': 2, 'get': {'_source': {}}},
+        })
+
+    @pytest.yield_fixture()
+    def request_context(self):
+        with Flask(__name__).test_request_context():
+            yield
+
+    @pytest.mark.usefixtures('request_context')
+    def test_reads_documents_once_per_request(self, es):
+        datastore = DataStore(es)
+
+        first = datastore.get_document('index', 'doc_type', 'a')
+        first['key1'] = 'modified by the caller'
+
+        assert datastore.get_document('index', 'doc_type', 'a')['key1'] == 'value1'
+        assert datastore.get_documents('index', 'doc_type', ['a', 'b'])[0]['key1'] == 'value1'
+        datastore.get_documents('index', 'doc_type', ['a', 'b'])
+
+        assert es.get.call_count == 1
+        assert es.mget.call_count == 1
+        assert es.mget.call_args[1]['body'] == {'ids': ['b']}
+
+    @pytest.mark.usefixtures('request_context')
+    def test_does_not_cache_selected_fields(self, es):
+        datastore = DataStore(es)
+
+        datastore.get_document('index', 'doc_type', 'a', fields=['key1'])
+        datastore.get_document('index', 'doc_type', 'a')
+
+        assert es.get.call_count == 2
+
+    @pytest.mark.usefixtures('request_context')
+    def test_multi_gets_selected_fields_past_the_cache(self, es):
+        datastore = DataStore(es)
+
+        datastore.get_documents('index', 'doc_type', ['a'])
+        datastore.get_documents('index', 'doc_type', ['a', 'b'], fields=['key1'])
+
+        assert es.mget.call_count == 2
+        assert es.mget.call_args[1]['body'] == {'ids': ['a', 'b']}
+        assert es.mget.call_args[1]['_source_include'] == ['key1']
+
+    @pytest.mark.usefixtures('request_context')
+    def test_writes_invalidate_cached_documents(self, es):
+        datastore = DataStore(es)
+
+        datastore.get_document('index', 'doc_type', 'a')
+        datastore.update_document('index_alias', 'doc_type', 'a', {'key1': 'value2'})
+        datastore.get_document('index', 'doc_type', 'a')
+
+        assert es.get.call_count == 2
+
+    def test_does_not_cache_outside_of_requests(self, es):
+        datastore = DataStore(es)
+
+        datastore.get_document('index', 'doc_type', 'a')
+        datastore.get_document('index', 'doc_type', 'a')
+
+        assert es.get.call_count == 2
+
+
+class TestDocumentCache(object):
+    @pytest.fixture()
+    def es(self):
+        return Mock(**{
+            'get.return_value': {'_id': 'a', '_version': 1, '_source': {'key1': 'value1'}},
+            'update.return_value': {'_id': 'a', '_version': 2, 'get': {'_source': {}}},
+        })
+
+    @pytest.fixture()
+    def datastore(self, es):
+        return DataStore(es, document_cache=DocumentCache(['category'], max_size=2))
+
+    def test_serves_cached_reads_across_requests(self, datastore, es):
+        datastore.get_document('index', 'category', 'a', cached=True)
+        datastore.get_document('index', 'category', 'a', cached=True)
+
+        assert es.get.call_count == 1
+        assert datastore.document_cache.counters['hits'] == 1
+
+    def test_only_caches_configured_doc_types_for_cached_reads(self, datastore, es):
+        datastore.get_document('index', 'category', 'a')
+        datastore.get_document('index', 'category', 'a')
+        datastore.get_document('index', 'venue', 'a', cached=True)
+        datastore.get_document('index', 'venue', 'a', cached=True)
+
+        assert es.get.call_count == 4
+
+    def test_bypasses_entries_of_other_versions(self, datastore, es):
+        datastore.get_document('index', 'category', 'a', cached=True)
+        datastore.get_document('index', 'category', 'a', version=2, cached=True)
+
+        assert es.get.call_count == 2
+
+    def test_updates_invalidate_entries(self, datastore, es):
+        datastore.get_document('index', 'category', 'a', cached=True)
+        datastore.update_document('index_alias', 'category', 'a', {'key1': 'value2'})
+        datastore.get_document('index', 'category', 'a', cached=True)
+
+        assert es.get.call_count == 2
+
+    def test_evicts_least_recently_used_entries(self):
+        cache = DocumentCache(['category'], max_size=2)
+
+        cache.put(('index', 'category', 'a'), {})
+        cache.put(('index', 'category', 'b'), {})
+        cache.get(('index', 'category', 'a'))
+        cache.put(('index', 'category', 'c'), {})
+
+        assert cache.get(('index', 'category', 'a')) == {}
+        assert cache.get(('index', 'category', 'b')) is None
+        assert cache.counters['evictions'] == 1
+
+    def test_forgets_documents_of_every_index(self):
+        cache = DocumentCache(['category'], max_size=2)
+
+        cache.put(('index', 'category', 'a'), {})
+        cache.put(('index_alias', 'category', 'a'), {})
+        cache.forget('category', 'a')
+
+        assert cache.get(('index', 'category', 'a')) is None
+        assert cache.get(('index_alias', 'category', 'a')) is None
+        assert not cache._keys
+
+    def test_forget_skips_uncached_doc_types(self):
+        cache = DocumentCache(['category'])
+        cache._lock = MagicMock()
+
+        cache.forget('venue', 'a')
+
+        assert not cache._lock.__enter__.called
+
+    def test_expires_entries(self):
+        cache = DocumentCache(['category'], ttl=-1)
+
+        cache.put(('index', 'category', 'a'), {})
+
+        assert cache.get(('index', 'category', 'a')) is None
@@ -0,0 +1,173 @@
+# coding: utf-8
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from flask import Flask
+from mock import Mock
+import pytest
+from sqlalchemy.exc import (
+    DataError,
+    IntegrityError,
+    OperationalError,
+    StatementError,
+)
+
+from reles import versioning
+from reles.versioning import (
+    VersionArchiver,
+    archive_document_version,
+    archive_document_versions,
+)
+
+
+def _version(number):
+    return 'book', 'ivanhoe', number, {'title': 'Ivanhoe', '_version': number}
+
+
+class TestVersionArchiver(object):
+    @pytest.fixture()
+    def inserted(self, monkeypatch):
+        """The batches passed to the multi-row INSERT."""
+        batches = []
+        monkeypatch.setattr(versioning, '_insert_versions', lambda versions: batches.append(
+            [tuple(version) for version in versions]
+        ))
+        monkeypatch.setattr(versioning, 'db', Mock())
+
+        return batches
+
+    @pytest.fixture()
+    def app(self):
+        return Flask(__name__)
+
+    @pytest.fixture()
+    def archiver(self, app, tmpdir):
+        app.version_archiver = VersionArchiver(
+            app,
+            str(tmpdir.join('versions.ndjson')),
+            max_size=3,
+            flush_threshold=2,
+            put_timeout=0.01,
+        )
+
+        return app.version_archiver
+
+    def test_inserts_queued_versions_in_batches(self, app, archiver, inserted):
+        with app.app_context():
+            archive_document_version(*_version(1))
+            archive_document_versions([_version(2), _version(3)])
+
+        assert inserted == []
+
+        archiver.flush()
+
+        assert inserted == [[_version(1), _version(2)], [_version(3)]]
+        assert archiver.counters['archived'] == 3
+
+    def test_archives_synchronously_on_request(self, app, archiver, inserted):
+        with app.app_context():
+            archive_document_versions([_version(1)], synchronous=True)
+
+        assert inserted == [[_version(1)]]
+        assert archiver._queue.empty()
+
+    def test_spills_and_replays_when_postgres_is_unavailable(
+        self, archiver, inserted, monkeypatch
+    ):
+        available = []
+
+        def insert(versions):
+            if not available:
+                raise OperationalError('INSERT', {}, Exception('connection refused'))
+
+            inserted.append(list(versions))
+
+        monkeypatch.setattr(versioning, '_insert_versions', insert)
+
+        archiver.archive([_version(1), _version(2)])
+        archiver.flush()
+
+        assert archiver.counters['spilled'] == 2
+        assert inserted == []
+
+        available.append(True)
+        archiver.flush()
+
+        assert inserted == [[_version(1), _version(2)]]
+        assert archiver.counters['replays'] == 1
+
+    def test_leaves_the_replay_to_the_process_holding_its_lock(
+        self, archiver, inserted, monkeypatch
+    ):
+        monkeypatch.setattr(versioning, '_insert_versions', Mock(
+            side_effect=OperationalError('INSERT', {}, Exception('connection refused'))
+        ))
+        archiver.archive([_version(1)])
+        archiver.flush()
+        monkeypatch.setattr(versioning, '_insert_versions', lambda versions: inserted.append(
+            list(versions)
+        ))
+
+        with versioning._file_lock(archiver._spill_path + '.replay.lock'):
+            archiver.flush()
+
+        assert inserted == []
+
+        archiver.flush()
+
+        assert inserted == [[_version(1)]]
+
+    def test_needs_a_spill_file(self, app):
+        with pytest.raises(ValueError):
+            VersionArchiver(app, '')
+
+    def test_spills_versions_exceeding_the_queue(self, archiver, inserted):
+        archiver.archive([_version(number) for number in range(1, 6)])
+
+        assert archiver.counters['overflows'] == 1
+        assert archiver.counters['spilled'] == 2
+
+        archiver.flush()
+
+        assert sorted(version for batch in inserted for version in batch) == [
+            _version(number) for number in range(1, 6)
+        ]
+
+    def test_drops_versions_violating_constraints(self, archiver, inserted, monkeypatch):
+        def insert(versions):
+            if any(version[2] == 2 for version in versions):
+                raise IntegrityError('INSERT', {}, Exception('duplicate key'))
+
+            inserted.append(list(versions))
+
+        monkeypatch.setattr(versioning, '_insert_versions', insert)
+
+        archiver.archive([_version(1), _version(2)])
+        archiver.flush()
+
+        assert inserted == [[_version(1)]]
+        assert archiver.counters['dropped'] == 1
+
+    @pytest.mark.parametrize('error', [
+        DataError('INSERT', {}, Exception('invalid input syntax')),
+        StatementError('unserializable document', 'INSERT', {}, TypeError()),
+    ])
+    def test_drops_versions_failing_permanently_instead_of_spilling_them(
+        self, archiver, inserted, monkeypatch, error
+    ):
+        def insert(versions):
+            if any(version[2] == 2 for version in versions):
+                raise error
+
+            inserted.append(list(versions))
+
+        monkeypatch.setattr(versioning, '_insert_versions', insert)
+
+        archiver.archive([_version(1), _version(2), _version(3)])
+        archiver.flush()
+        archiver.flush()
+
+        assert inserted == [[_version(1)], [_version(3)]]
+        assert archiver.counters['dropped'] == 1
+        assert archiver.counters['spilled'] == 0
+        assert archiver.counters['replays'] == 0
@@ -8,6 +8,7 @@ import pytest
 from reles.references import (
     assign_to_field_reference,
     resolve_field_reference,
+    select_field_references,
 )
 
 
@@ -92,6 +93,18 @@ class TestTheFieldResolution(object):
         # resolves to a list of no matches
         assert values == []
 
+    def test_skips_values_that_are_no_documents(self, full_entity):
+        full_entity['foo']['bar']['baz'][0]['qux'] = 'a foreign key'
+
+        values = resolve_field_reference('foo.bar.baz.qux.quux', None, full_entity)
+
+        assert values == [full_entity['foo']['bar']['baz'][1]['qux']['quux']]
+
+        assign_to_field_reference('foo.bar.baz.qux.quux', full_entity, ['grault'])
+
+        assert full_entity['foo']['bar']['baz'][0]['qux'] == 'a foreign key'
+        assert full_entity['foo']['bar']['baz'][1]['qux']['quux'] == 'grault'
+
     def test_can_assign_values(self, full_entity):
         field = 'grault'
         values = ['one', 'two']
@@ -141,3 +154,26 @@ class TestTheFieldResolution(object):
 
         assert '{} values'.format(len(values)) in exception_info.value.message
         assert '{} documents'.format(len(full_entity['foo']['bar']['baz'])) in exception_info.value.message
+
+    def test_can_select_fields(self, full_entity):
+        full_entity['_id'] = 'an_id'
+        full_entity['grault'] = 'garply'
+
+        selected = select_field_references(['foo.bar.baz.qux.quux'], full_entity)
+
+        assert selected == {
+            '_id': 'an_id',
+            'foo': {
+                'bar': {
+                    'baz': [
+                        {'qux': {'quux': 'corge'}},
+                        {'qux': {'quux': 'waldo'}},
+                    ]
+                }
+            }
+        }
+
+    def test_selects_fields_as_a_whole(self, full_entity):
+        selected = select_field_references(['foo.bar', 'foo.bar.baz.qux.quux'], full_entity)
+
+        assert selected == full_entity
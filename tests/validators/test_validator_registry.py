@@ -0,0 +1,78 @@
+# coding: utf-8
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from tempfile import gettempdir
+
+from jsonschema import ValidationError
+from mock import create_autospec
+import pytest
+
+from reles.persistence import DataStore, SwaggerSchemaStore
+from reles.validators import CustomDraft4Validator, ValidatorRegistry
+
+
+def _spec(required):
+    return {
+        'definitions': {
+            'book': {
+                'type': 'object',
+                'required': [required],
+                'properties': {
+                    'title': {'type': 'string'},
+                    'isbn': {'type': 'string'},
+                }
+            }
+        }
+    }
+
+
+@pytest.fixture
+def schemastore():
+    store = SwaggerSchemaStore()
+    store.add_schema('library', _spec('title'))
+
+    return store
+
+
+@pytest.fixture
+def registry(schemastore):
+    _registry = ValidatorRegistry(
+        schemastore,
+        create_autospec(DataStore, instance=True),
+        gettempdir(),
+    )
+    _registry.compile_all()
+
+    return _registry
+
+
+class TestValidatorRegistry(object):
+    def test_returns_compiled_validators(self, registry):
+        validator = registry.get('library', 'book')
+
+        assert isinstance(validator, CustomDraft4Validator)
+        assert registry.get('library', 'book') is validator
+
+    def test_returns_none_for_unknown_schemas(self, registry):
+        assert registry.get('library', 'magazine') is None
+        assert registry.get('nosuch', 'book') is None
+
+    def test_binding_does_not_modify_the_compiled_validator(self, registry):
+        validator = registry.get('library', 'book')
+
+        bound = validator.bind(index='library_kattegat_index', doc_type='book')
+
+        assert bound.index == 'library_kattegat_index'
+        assert bound.doc_type == 'book'
+        assert bound.schema is validator.schema
+        assert bound.resolver is not validator.resolver
+        assert validator.index is None
+
+    def test_recompiles_replaced_schemas(self, registry, schemastore):
+        registry.get('library', 'book').validate({'title': 'Ivanhoe'})
+
+        schemastore.add_schema('library', _spec('isbn'))
+
+        with pytest.raises(ValidationError):
+            registry.get('library', 'book').validate({'title': 'Ivanhoe'})
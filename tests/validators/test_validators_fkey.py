@@ -10,8 +10,10 @@ from uuid import uuid4
 
 from elasticsearch.exceptions import NotFoundError
 from jsonschema import ValidationError
+from mock import create_autospec
 import pytest
 
+from reles.persistence import DataStore
 from reles.validators import CustomDraft4Validator
 
 
@@ -112,3 +114,74 @@ class TestValidatorFkeyArray(object):
             validator_array_items.validate({'parents': [hit_document_id, miss_document_id]})
 
         assert 'Invalid foreign key: no such document' in e.value.message
+
+
+class TestValidatorFkeyBatching(object):
+    @pytest.fixture()
+    def mocked_datastore(self):
+        existing = {'a', 'b'}
+
+        datastore = create_autospec(DataStore, instance=True)
+        datastore.get_documents.side_effect = lambda index, doc_type, ids, **kwargs: [
+            {'_id': id} if id in existing else None for id in ids
+        ]
+
+        return datastore
+
+    @pytest.fixture()
+    def validator(self, mocked_datastore):
+        fkey = {'index': 'test_index', 'doc_type': 'test_doc_type'}
+        schema = {
+            'type': 'object',
+            'properties': {
+                'parent': {'type': 'string', 'x-fkey': fkey},
+                'parents': {
+                    'type': 'array',
+                    'items': {'type': 'string', 'x-fkey': fkey},
+                },
+            },
+        }
+
+        return CustomDraft4Validator(
+            schema,
+            datastore=mocked_datastore,
+            upload_path=gettempdir(),
+        )
+
+    def test_resolves_all_references_at_once(self, validator, mocked_datastore):
+        # does not raise:
+        validator.validate({'parent': 'a', 'parents': ['a', 'b']})
+
+        mocked_datastore.get_documents.assert_called_once_with(
+            'test_index',
+            'test_doc_type',
+            ['a', 'b'],
+            cached=True,
+        )
+        assert not mocked_datastore.get_document.called
+
+    def test_reports_every_missing_reference(self, validator):
+        errors = list(validator.iter_errors({'parent': 'x', 'parents': ['a', 'y']}))
+
+        assert sorted(error.message for error in errors) == [
+            'Invalid foreign key: no such document test_index/test_doc_type/x',
+            'Invalid foreign key: no such document test_index/test_doc_type/y',
+        ]
+
+    def test_reports_where_references_are_missing(self, validator):
+        errors = list(validator.iter_errors({'parent': 'x', 'parents': ['a', 'y']}))
+
+        assert sorted((list(error.path), list(error.schema_path)) for error in errors) == [
+            (['parent'], ['properties', 'parent', 'x-fkey']),
+            (['parents', 1], ['properties', 'parents', 'items', 'x-fkey']),
+        ]
+
+    def test_reports_references_into_missing_indexes(self, validator, mocked_datastore):
+        mocked_datastore.get_documents.side_effect = NotFoundError(404, 'index_not_found_exception')
+
+        errors = list(validator.iter_errors({'parent': 'a', 'parents': ['b']}))
+
+        assert sorted(error.message for error in errors) == [
+            'Invalid foreign key: no such document test_index/test_doc_type/a',
+            'Invalid foreign key: no such document test_index/test_doc_type/b',
+        ]